@@ -1,19 +1,25 @@
 import streamlit as st
 import os
+from concurrent.futures import ThreadPoolExecutor
 from streamlit_folium import st_folium
 import folium
-from geopy.geocoders import Nominatim
-import requests
 from datetime import datetime
 import numpy as np
 import pandas as pd
 import math
-import pickle
-import sklearn
-import pytz
-import timezonefinder
-import gdown
-import xgboost
+# scikit-learn and XGBoost are imported when the model is unpickled in the background, geopy and timezonefinder on first use
+# python benchmarks/import_times.py reports the import cost of each module
+from caching import TTLCache
+from enrichment import enrich_location
+from weather import WeatherCache, weather_provider
+from predictor import SEVERITY_COLORS, SEVERITY_DISPLAY, SEVERITY_LABELS, Predictor, local_time_at, prepare_location
+from grid_scoring import score_viewport, viewport_bounds
+from timezones import get_resolver
+from prediction_log import PredictionLog
+from model_store import load_model as load_model_artifact
+from fast_inference import compile_model
+from instrumentation import metrics
+from backends import nominatim_client, overpass_client, weather_client
 
 # Link to presentation document
 presentation = st.secrets["Documents"]["presentation"]
@@ -41,14 +47,26 @@ st.set_page_config(
     }
 )
 
-# Import the optimized model features                                   
-model_features = pd.read_csv("model_features.csv")
-model_features = model_features[model_features["Feature"] != "Severity"]
+# Import the optimized model features (read once per process)
+@st.cache_data
+def load_model_features():
+    model_features = pd.read_csv("model_features.csv")
+    return model_features[model_features["Feature"] != "Severity"]
 
-# Load the prediction log
-prediction_log = pd.read_csv("prediction_log.csv") # Loads a persistent prediction log
+model_features = load_model_features()
 
-tab1, tab2 = st.tabs(["Traffic Impact Predictor", "Prediction Log"])
+# Load the prediction log, shared by every session (the example predictions in prediction_log.csv seed a new log)
+@st.cache_resource
+def load_prediction_log():
+    return PredictionLog("prediction_log.db", seed_csv="prediction_log.csv")
+
+# Show the diagnostics tab only when asked for, with ?diagnostics=1 in the URL or the ACCIDENT_DIAGNOSTICS environment variable
+show_diagnostics = st.query_params.get("diagnostics") == "1" or bool(os.environ.get("ACCIDENT_DIAGNOSTICS"))
+
+if show_diagnostics:
+    tab1, tab2, tab3 = st.tabs(["Traffic Impact Predictor", "Prediction Log", "Diagnostics"])
+else:
+    tab1, tab2 = st.tabs(["Traffic Impact Predictor", "Prediction Log"])
 
 with tab1:
     # Set page title
@@ -56,32 +74,51 @@ with tab1:
 
     ##### RETRIEVE AND LOAD MODEL #####
 
-    # Specify the Google Drive file url to enable download and retrieval of the model .pkl file from Google Drive 
+    # Define the openweathermaps.org API key to use
+    API_KEY_owm = st.secrets["API_Keys"]["API_KEY_owm"] # my API key
+
+    # Define the cache of enriched locations, shared across reruns and sessions so each distinct location is only geocoded once
+    @st.cache_resource
+    def load_enrichment_cache():
+        return TTLCache(max_entries=512, ttl=15*60) # hold up to 512 locations for 15 minutes
+
+    enrichment_cache = load_enrichment_cache()
+    metrics.register_collector("location_cache", enrichment_cache.stats)
+
+    # Define the weather cache, shared across reruns and sessions so nearby locations within the same 10 minutes share one weather request
+    @st.cache_resource
+    def load_weather_cache():
+        return WeatherCache(weather_provider(API_KEY_owm))
+
+    weather_cache = load_weather_cache()
+    metrics.register_collector("weather_cache", weather_cache.stats)
+
+    # Specify the Google Drive file id to enable download and retrieval of the model .pkl file from Google Drive 
     # Model file IDs from Google Drive
     randomforest_id = st.secrets["Model_pkl_IDs"]["randomforest_id"] # Random Forest Model
     xgboost_id = st.secrets["Model_pkl_IDs"]["xgboost_id"] # XGBoost Model
     blended_id = st.secrets["Model_pkl_IDs"]["blended_id"] # Blended RF+XGB Model
     file_id = blended_id
-    url = f"https://drive.google.com/uc?id={file_id}"
+    # Optional checksum the downloaded model file must match
+    expected_sha256 = st.secrets["Model_pkl_IDs"].get("blended_sha256")
 
-    # Define function to download and load model, caching the result
-
-    @st.cache_resource
+    # Define function to load the model and build the predictor around it, compiled into the fast inference engine (falls back to the model itself if the compiled version does not reproduce its predictions)
+    # The model is kept in a local store keyed on the file id and only downloaded when no valid copy is stored
+    # The predictor scores with the same pipeline as the prediction service, sharing the enrichment and weather caches defined above
     def load_model():
-        gdown.download(url, "applet_model.pkl", quiet=False)
-        # Define the model
-        with open('applet_model.pkl', 'rb') as file:
-            model = pickle.load(file)
-        return model
+        model, model_timings = load_model_artifact(file_id, expected_sha256=expected_sha256)
+        return model, model_timings, Predictor(compile_model(model), model_features["Feature"].values, enrichment_cache, weather_cache)
 
-    # Load the model
-    model = load_model()
+    # Start loading the model in the background when the first session starts, so the page and map render while it downloads and deserializes
+    # The timezone grid is built alongside it, both are shared by every session in the process
+    @st.cache_resource
+    def start_warm_up():
+        warm_up = ThreadPoolExecutor(max_workers=2, thread_name_prefix="warm-up")
+        return warm_up.submit(load_model), warm_up.submit(get_resolver)
 
-    # Define callable prediction function to invoke the model on input data
-    def severity_predictor(input):
-        # Generate prediction    
-        prediction = model.predict(input)
-        return prediction
+    model_loading, _ = start_warm_up()
+    if model_loading.done() and model_loading.exception() is not None:
+        start_warm_up.clear() # a failed load is retried on the next run
 
     ##### RETRIEVE AND LOAD MODEL COMPLETE ##### 
 
@@ -89,7 +126,14 @@ with tab1:
     # Display explanation of the app
     with st.expander(label="About this app."):
         st.write("The purpose of this app is to use a pretrained machine learning model to predict how severe the traffic impact will be as a result of an accident.") 
-        st.write(f"""The current version of this app uses a {model.__class__.__name__} model {'with constituent models' if model.__class__.__name__=='VotingClassifier' else ''} {' and '.join([estimator.__class__.__name__ for _, estimator in model.estimators]) if model.__class__.__name__=='VotingClassifier' else ''} trained on the following features: {', '.join(model_features["Feature"].astype(str))}.
+        # The model is described once it has finished loading
+        if model_loading.done() and model_loading.exception() is None:
+            model, model_timings, predictor = model_loading.result()
+            model_description = f"{model.__class__.__name__} model {'with constituent models' if model.__class__.__name__=='VotingClassifier' else ''} {' and '.join([estimator.__class__.__name__ for _, estimator in model.estimators]) if model.__class__.__name__=='VotingClassifier' else ''}"
+        else:
+            model_timings = None
+            model_description = "blended Random Forest and XGBoost model (still loading)"
+        st.write(f"""The current version of this app uses a {model_description} trained on the following features: {', '.join(model_features["Feature"].astype(str))}.
             The model was developed around the ['US Accidents (2016-2023)'](https://www.kaggle.com/datasets/sobhanmoosavi/us-accidents) dataset found on kaggle.
             The dataset contains approximately 7.7 million accident records from the continental United States between the years 2016-2023 with 46 original features.
             Undersampling, data cleaning, and feature selection was performed on the original dataset to prepare it for model development.
@@ -109,37 +153,21 @@ with tab1:
                 \n10. The prediction and input variables are displayed by the app in a user friendly format. 
         """)
         st.write("Identify accident location by selecting a point on the map.")
+        if model_timings is not None:
+            st.caption(f"Model startup: download {model_timings['download']:.2f} s, deserialize {model_timings['deserialize']:.2f} s, first prediction {model_timings['first_predict'] or 0:.2f} s")
+            if predictor.model is model and model.__class__.__name__=='VotingClassifier':
+                st.caption("Fast inference is off: the compiled model did not reproduce the original model's predictions, so the original model is used.")
     st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
 
 
     ##### DEFINE FUNCTIONS #####
 
-    # Define the openweathermaps.org API key to use
-    API_KEY_owm = st.secrets["API_Keys"]["API_KEY_owm"] # my API key
+    # Define the cache of road geometry and traffic signals fetched for scored map views, so scoring the same view again only refreshes the weather
+    @st.cache_resource
+    def load_road_cache():
+        return TTLCache(max_entries=32, ttl=60*60)
 
-    # Define function to reverse geocode (get address from lat/lng)
-    def reverse_geocode(lat, lon):
-        geolocator = Nominatim(user_agent="accident_input")
-        try:
-            location = geolocator.reverse((lat, lon), exactly_one=True)
-            if location:
-                return location.raw['address']
-            else:
-                return None
-        except Exception as e: # Handle errors
-            return "Error: An unexpected error occurred. Please try again."
-
-    # Define function to fetch weather data from OpenWeatherMap
-    def get_weather_data(lat, lon, api_key):
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=imperial"
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
-        
-    # Define variable that will get the timezone name based on latitude and longitude
-    tf = timezonefinder.TimezoneFinder()
+    road_cache = load_road_cache()
 
     # Define function to convert latitude and longitude values from decimal to degrees/minutes/seconds format
     def decimal_to_dms(decimal_coord, coord_type):
@@ -159,6 +187,24 @@ with tab1:
             direction = 'W' if is_negative else 'E'
         return f"{degrees}° {minutes}' {seconds:.2f}\" {direction}"
 
+    # Define function to run a stage of the click pipeline only when its inputs differ from the previous run of this session
+    # Streamlit reruns the whole script on every widget interaction, so unchanged stages reuse their stored output (returns the output and whether it was recomputed)
+    # Outputs that keep rejects (failed or partial results) are not stored, so the next rerun computes the stage again
+    def run_stage(name, inputs, compute, keep=None):
+        stages = st.session_state.setdefault("pipeline_stages", {})
+        stage = stages.get(name)
+        if stage is not None and stage["inputs"] == inputs:
+            metrics.increment("pipeline_stage_total", stage=name, result="reused")
+            return stage["output"], False
+        metrics.increment("pipeline_stage_total", stage=name, result="computed")
+        with metrics.timer("stage_seconds", stage=name):
+            output = compute()
+        if keep is None or keep(output):
+            stages[name] = {"inputs": inputs, "output": output}
+        else:
+            stages.pop(name, None)
+        return output, True
+
     ##### DEFINE FUNCTIONS COMPLETE #####
 
 
@@ -170,12 +216,48 @@ with tab1:
         lat_start = 35.2286
         lon_start = -80.8348
 
+        # Heatmap mode scores road points across the whole map view instead of only the clicked point
+        heatmap_mode = st.toggle("Severity heatmap of the map view", help="Scores a grid of road points across the current map view and colors each by its predicted severity.")
+
         # Create a map centered on the starting location
         m = folium.Map(location=[lat_start, lon_start], zoom_start=15)
         # Add a click event to the map to capture user-selected point
         m.add_child(folium.LatLngPopup())
+        # Draw the last scored view as a layer of road points colored by severity (added without re-rendering the map, so the view is kept)
+        heatmap = st.session_state.get("heatmap")
+        heatmap_layer = None
+        if heatmap_mode and heatmap is not None:
+            heatmap_layer = folium.FeatureGroup(name="Predicted severity")
+            for point in heatmap["results"].itertuples():
+                folium.CircleMarker(
+                    location=[point.lat, point.lon], radius=5, weight=0, fill=True, fill_opacity=0.7,
+                    fill_color=SEVERITY_COLORS[point.severity], tooltip=SEVERITY_LABELS[point.severity],
+                ).add_to(heatmap_layer)
         # Display the map in Streamlit and capture the click event
-        map_output = st_folium(m, width=1350, height=850)
+        map_output = st_folium(m, width=1350, height=850, feature_group_to_add=heatmap_layer)
+
+        if heatmap_mode:
+            if st.button("Score map view"):
+                bounds = map_output.get("bounds")
+                if not bounds or bounds["_southWest"]["lat"] is None:
+                    st.warning("Move or zoom the map, then score the view.")
+                else:
+                    try:
+                        with st.spinner("Scoring road points in view..."):
+                            _, _, predictor = model_loading.result()
+                            results, stats, warnings = score_viewport(viewport_bounds(bounds), predictor.model, predictor.layout, weather_cache, road_cache)
+                        st.session_state["heatmap"] = {"results": results, "stats": stats, "warnings": warnings}
+                    except ValueError as e:
+                        st.warning(str(e))
+                    except Exception as e:
+                        st.warning(f"The map view could not be scored: {e}")
+                    else:
+                        st.rerun() # draw the new layer
+            if heatmap is not None:
+                for warning in heatmap["warnings"]:
+                    st.warning(warning)
+                stats = heatmap["stats"]
+                st.caption(f"{stats['scored']} of {stats['road_points']} road points scored in {stats['seconds']:.2f} s, sharing {stats['weather_cells']} weather lookups")
 
         ##### PROCESS USER'S ACCIDENT INPUT #####
         start_time = datetime.now()
@@ -184,36 +266,27 @@ with tab1:
             # Instantiate the location to the default starting location
             lat = lat_start
             lon = lon_start
-            timezone_str = tf.timezone_at(lat=lat, lng=lon)
         elif map_output['last_clicked'] is not None:
             # Instantiate the location to the user selection
             lat = map_output['last_clicked']['lat']
             lon = map_output['last_clicked']['lng']
-            timezone_str = tf.timezone_at(lat=lat, lng=lon)
-
-        # Apply the timezone and generate local time
-        if timezone_str:
-            local_timezone = pytz.timezone(timezone_str)
-            local_time = datetime.now(local_timezone)
-            local_time = pd.to_datetime(local_time, format='ISO8601')
-        else:
-            local_time = "Timezone could not be determined for the given coordinates."
+        # Generate the local time at the location, None if its timezone could not be determined (waits for the grid if the warm-up is still building it)
+        with metrics.timer("stage_seconds", stage="timezone"):
+            local_time = local_time_at(lat, lon)
+
+        # Run the geocode, weather and Overpass lookups for the selected location concurrently (computed once per location and cached)
+        # Reruns with the same location reuse the previous enrichment until the weather cache moves on to a new time bucket
+        # Only complete enrichments are reused, after a failed or partial lookup the next rerun tries the backends again
+        enrichment, _ = run_stage("enrichment", (lat, lon, weather_cache.key(lat, lon)), lambda: enrich_location(lat, lon, enrichment_cache, weather_cache),
+                                  keep=lambda enrichment: enrichment.location_complete and enrichment.weather_data is not None)
+        for warning in enrichment.warnings:
+            st.warning(warning)
+
+        # Display address from the reverse geocoded lat/lng
+        address = enrichment.address
         
-        # Reverse geocode the selected lat/lng to get address details and display address
-        if isinstance(reverse_geocode(lat, lon), str) and "Error" in reverse_geocode(lat, lon):
-            address = reverse_geocode(lat, lon)
-        elif reverse_geocode(lat, lon):
-            house_number = reverse_geocode(lat, lon).get('house_number')
-            street = reverse_geocode(lat, lon).get('road')
-            city = reverse_geocode(lat, lon).get('city')
-            state = reverse_geocode(lat, lon).get('state')
-            zipcode = reverse_geocode(lat, lon).get('postcode')
-            address = f"{house_number} {street}, {city}, {state} {zipcode}"
-        else:
-            address = "Address data could not be retrieved."
-        
-        # Fetch weather data based on the selected location
-        weather_data = get_weather_data(lat, lon, API_KEY_owm)
+        # Retrieve weather data based on the selected location
+        weather_data = enrichment.weather_data
         if weather_data:
             # Define weather information
             temp = weather_data['main']['temp']
@@ -243,100 +316,16 @@ with tab1:
         #    traffic_signal = True
 
         ##### USE OPENSTREETMAPS OVERPASS API TO MAKE CERTAIN CHECKS #####
-        # Define OSM's Overpass API URL
-        url_osm = "http://overpass-api.de/api/interpreter"
-        ## Determine traffic signal presence ##
-        # Define Overpass query to retrieve traffic signals within 400 meters (about 1/4 mile) from the selected accident location
-        query_signal = f"""
-        [out:json][timeout:60];
-        node["highway"="traffic_signals"](around:400,{lat},{lon});
-        out body;
-        """
-        # Send the request with retry logic for 504 errors
-        import time
-        traffic_presence = {'elements': []}
-        signal_message = st.empty() # Placeholder for status messages related to the traffic signal API request
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response_signal = requests.post(url_osm, data=query_signal, timeout=30)
-                # Check if response is OK before parsing JSON
-                if response_signal.status_code == 200:
-                    traffic_presence = response_signal.json()
-                    signal_message.empty()
-                    break
-                elif response_signal.status_code == 504:
-                    if attempt < max_retries - 1:
-                        signal_message.info(f"Overpass API busy. Retrying check of signals... ({attempt+1}/{max_retries})")
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                    else:
-                        signal_message.warning("Overpass API remained busy after all retries.")
-                else:
-                    signal_message.warning(f"Signal API status: {response_signal.status_code}")
-                    break
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    signal_message.info(f"Signal request timed out. Retrying check of signals... ({attempt+1}/{max_retries})")
-                    time.sleep(2 ** attempt)
-            except Exception as e:
-                signal_message.warning(f"Signal API error: {e}")
-                break
-        
-        # Define the traffic_signal variable. An empty set returned from the OSM query implies no traffic signals within the 1/4 mile radius
-        if traffic_presence['elements']==[]:
-            traffic_signal = False
-        else:
-            traffic_signal = True
-        ## Perform check to determine if the selected location is a road ##
-        # Define Overpass query to retrieve roads within 15 meters (about 50 feet) from the selected accident location
-        query_roads = f"""
-        [out:json];
-        way["highway"](around:15,{lat},{lon});
-        out ids;
-        """
-        # Send the request with retry logic for 504 errors
-        roads_presence = {'elements': []}
-        road_message = st.empty() # Placeholder for status messages related to the roads API request
-        for attempt in range(max_retries):
-            try:
-                response_roads = requests.post(url_osm, data=query_roads, timeout=30)
-                # Check if response is OK before parsing JSON
-                if response_roads.status_code == 200:
-                    roads_presence = response_roads.json()
-                    road_message.empty()
-                    break
-                elif response_roads.status_code == 504:
-                    if attempt < max_retries - 1:
-                        road_message.info(f"Overpass API busy. Retrying check of roads... ({attempt+1}/{max_retries})")
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                    else:
-                        road_message.warning("Overpass API remained busy after all retries.")
-                else:
-                    road_message.warning(f"Roads API status: {response_roads.status_code}")
-                    break
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    road_message.info(f"Roads request timed out. Retrying check of roads... ({attempt+1}/{max_retries})")
-                    time.sleep(2 ** attempt)
-            except Exception as e:
-                road_message.warning(f"Roads API error: {e}")
-                break
-        
-        # Define the is_road variable. An empty set returned from the OSM query implies that the selected location is not within 50 feet of a road
-        if roads_presence['elements']==[]:
-            is_road = False
-        else:
-            is_road = True
-
-        ##### Store accident conditions in a DataFrame #####
-        if weather_data is not None and reverse_geocode(lat, lon) is not None:
-            columns = ["Start_Month", "Start_Day", "Start_Hour", "Start_Lat", "Start_Lng", "Temperature(F)", "Pressure(in)", "Visibility(mi)", "Humidity(%)", "Wind_Speed(mph)", "Traffic_Signal"]
-            inputs = [[local_time.month, local_time.dayofweek, local_time.hour, lat, lon, temp, pressure, visibility, humidity, wind_speed, traffic_signal]]
-            user_input = pd.DataFrame(inputs, columns=columns)   
-            user_input = user_input[model_features["Feature"].values] # Reorder the input features to match what the model expects to see
-            # Display model input DataFrame (not displayed in production app)
-            #st.write("Features to load into model:")
-            #st.write(user_input)
+        # Define the traffic_signal variable from the traffic signals found within 400 meters (about 1/4 mile) from the selected accident location
+        traffic_signal = enrichment.traffic_signal
+        # Define the is_road variable from the roads found within 15 meters (about 50 feet) from the selected accident location
+        is_road = enrichment.is_road
+
+        ##### Assemble the model input row, or the reason the location cannot be scored #####
+        prepared = prepare_location(lat, lon, local_time, enrichment)
+        # Display model input (not displayed in production app)
+        #st.write("Features to load into model:")
+        #st.write(prepared.row)
 
     with col2: # output area
         # Display prompt if no user input detected
@@ -345,25 +334,13 @@ with tab1:
             st.header("Navigate to and click on accident location on map.")
             st.divider()
         # If user input is detected generate and display prediction
-        elif map_output['last_clicked'] is not None and weather_data is not None and reverse_geocode(lat, lon) is not None and is_road==True:
+        elif prepared.row is not None:
             try:
-                severity_prediction = severity_predictor(user_input)
-                if severity_prediction==1:
-                    message = "Minor"
-                    color = "green"
-                    size = 52
-                elif severity_prediction==2:
-                    message = "Moderate"
-                    color = "yellow"
-                    size = 54
-                elif severity_prediction==3:
-                    message = "Major"
-                    color = "orange"
-                    size = 56
-                elif severity_prediction==4:
-                    message = "SEVERE"
-                    color = "red"
-                    size = 58
+                # Only run the model when an input feature changed (new location, new weather, or the local month, day or hour moved on)
+                # st_folium reports a click as its coordinates only, so clicking the same point again within the same hour and weather is treated as a rerun and not logged again
+                # Waits for the background load the first time a prediction is needed
+                severity_prediction, prediction_is_new = run_stage("prediction", tuple(prepared.row), lambda: model_loading.result()[2].score([prepared]))
+                message, color, size = SEVERITY_DISPLAY[int(severity_prediction[0])]
                 st.divider()
                 st.header("Accident traffic impact:")
                 st.markdown(f"<h1 style='color: {color}; font-size: {size}px;'>{severity_prediction[0]} | {message}</h1>", unsafe_allow_html=True)
@@ -372,24 +349,9 @@ with tab1:
             except Exception as e2:
                 st.write("Error running model:", e2)
         # Otherwise return prompts if the location does not meet necessary requirements for a prediction 
-        elif map_output['last_clicked'] is not None and is_road==False:
-            st.divider()
-            st.header("Selected location is not a road.")
-            st.header("Please try again.")
-            st.divider()
-        elif map_output['last_clicked'] is not None and weather_data is None and reverse_geocode(lat, lon) is not None:
-            st.divider()
-            st.header("Failed to retrieve weather data.")
-            st.header("Please try again.")
-            st.divider()
-        elif map_output['last_clicked'] is not None and weather_data is not None and reverse_geocode(lat, lon) is None:
-            st.divider()
-            st.header("Address not valid.")
-            st.header("Please try again.")
-            st.divider()
-        elif map_output['last_clicked'] is not None:
+        else:
             st.divider()
-            st.header("Prediction cannot be generated")
+            st.header(prepared.error)
             st.header("Please try again.")
             st.divider()
         
@@ -432,8 +394,11 @@ with tab1:
                 st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
 
         end_time = datetime.now()
+        metrics.observe("click_seconds", (end_time - start_time).total_seconds())
         st.write("")
-        st.write(f"Processing time: {(np.timedelta64((end_time-start_time), 's')/np.timedelta64(1, 's')):.0f} seconds")
+        st.write(f"Processing time: {(end_time - start_time).total_seconds():.2f} seconds")
+        cache_stats = enrichment_cache.stats()
+        st.caption(f"Location cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} locations stored")
 
 # Log the prediction
 with tab2:
@@ -441,10 +406,33 @@ with tab2:
     with st.expander(label="About this log."):
         st.write("This tab records the log of predictions for the current session. It initializes with a few previous predictions shown as examples of what to expect.") 
     st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
-    # prediction_log = pd.DataFrame(columns=["Traffic Impact Prediction", "Local Time", "Latitude", "Longitude", "Temperature (°F)", "Pressure (inHg)", "Visibility (mi)", "Humidity (%)", "Wind Speed (mph)", "Traffic Signal"]) # This line can be used to reset the log
-    if "severity_prediction" in locals() or 'severity_prediction' in globals():
+    # Deleting prediction_log.db resets the log
+    prediction_log = load_prediction_log() # Loads a persistent prediction log
+    if ("severity_prediction" in locals() or 'severity_prediction' in globals()) and prediction_is_new: # Reruns that reused the previous prediction are not logged again
         prediction_latest = [severity_prediction[0], local_time, decimal_to_dms(lat, "lat"), decimal_to_dms(lon, "lon"), temp, np.round(pressure, 2), np.round(visibility, 2), humidity, wind_speed, traffic_signal]
-        prediction_log.loc[len(prediction_log)] = prediction_latest
-        prediction_log.to_csv("prediction_log.csv", index=False)
-    st.dataframe(prediction_log)
-
+        prediction_log.append(prediction_latest) # Written in the background, the log is never rewritten
+    # Display the log one page at a time, most recent predictions first
+    page_size = 50
+    page_count = max(math.ceil(prediction_log.count() / page_size), 1)
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+    st.dataframe(prediction_log.recent(limit=page_size, offset=(page - 1) * page_size))
+    st.caption(f"Page {page} of {page_count}")
+
+# Display the latency and cache diagnostics of this process
+if show_diagnostics:
+    with tab3:
+        st.header("Diagnostics", divider="gray")
+        st.write("Per-stage timings (seconds), retries and HTTP statuses of the backend requests, and cache counts recorded since the app process started.")
+        st.subheader("Stage timings")
+        st.dataframe(pd.DataFrame(metrics.summary()))
+        st.subheader("Counters")
+        st.dataframe(pd.DataFrame(metrics.counter_rows()))
+        st.subheader("Caches")
+        st.dataframe(pd.DataFrame({"location": enrichment_cache.stats(), "weather": weather_cache.stats()}))
+        st.subheader("Backends")
+        st.dataframe(pd.DataFrame({client.name: client.stats() for client in (nominatim_client, weather_client, overpass_client)}))
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Export Prometheus text", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        with col2:
+            st.download_button("Export JSONL", metrics.to_jsonl(), file_name="metrics.jsonl", mime="application/jsonl")
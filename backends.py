@@ -0,0 +1,185 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from instrumentation import metrics
+
+# Status codes that mean the backend is busy and the request is worth retrying
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+# Define a token bucket limiting the rate of requests to a backend, shared by every session in the process
+# Tokens refill at rate per second up to burst; callers wait for a token but give up rather than wait longer than their timeout
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = rate # tokens per second
+        self.burst = burst # most tokens held at once
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Take a token, waiting up to timeout seconds for one; returns False if none would be available in time
+    def acquire(self, timeout):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            if wait > timeout:
+                return False
+            self.tokens -= 1 # reserved now, so waiting callers are served in order
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+# Define a circuit breaker that stops calls to a backend after repeated failures
+# After failure_threshold consecutive failures the circuit opens and calls are refused for reset_timeout seconds,
+# then a single trial call is let through (half open): success closes the circuit, failure opens it again
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0 # consecutive failures
+        self.opened = None # when the circuit last opened, None while closed
+        self.trial_started = None # when the half open trial call was let through
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened is None:
+                return "closed"
+            return "open" if time.monotonic() - self.opened < self.reset_timeout else "half_open"
+
+    # True if a call may be made now
+    def allow(self):
+        with self._lock:
+            if self.opened is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened < self.reset_timeout:
+                return False
+            # Half open: let one trial through at a time (a trial that never reported back is replaced after reset_timeout)
+            if self.trial_started is None or now - self.trial_started >= self.reset_timeout:
+                self.trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self.trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened is not None or self.failures >= self.failure_threshold:
+                self.opened = time.monotonic()
+                self.trial_started = None
+
+
+# Define a client for an external backend that retries busy responses and timeouts with jittered exponential backoff
+# Requests go through a pooled session so repeat calls reuse open connections instead of repeating the TCP/TLS handshake
+# Every session in the process shares the client's rate limit (rate_limit requests per second, None for no limit) and circuit breaker,
+# so a degraded backend is left alone to recover instead of every session piling retries onto it
+class BackendClient:
+    def __init__(self, name, timeout, max_retries, pool_size=16, rate_limit=None, burst=1, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.timeout = timeout # seconds allowed per attempt
+        self.max_retries = max_retries # total number of attempts
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    # Longest a request can take: every attempt waiting for a token and timing out, plus the backoff between attempts
+    @property
+    def budget(self):
+        token_wait = self.timeout if self.limiter is not None else 0
+        return (self.timeout + token_wait) * self.max_retries + sum(2 ** attempt for attempt in range(self.max_retries - 1))
+
+    # Check the circuit and wait for a rate limit token, returning a warning when the call should not be made (None when it may)
+    def admit(self):
+        if not self.breaker.allow():
+            metrics.increment("backend_rejected_total", backend=self.name, reason="circuit_open")
+            return f"{self.name} API is unavailable, skipping it while it recovers."
+        if self.limiter is not None and not self.limiter.acquire(timeout=self.timeout):
+            metrics.increment("backend_rejected_total", backend=self.name, reason="rate_limited")
+            return f"{self.name} API request limit reached, please try again shortly."
+        return None
+
+    # Wait before the next attempt, a random share of the exponential backoff so clients that failed together do not retry together
+    @staticmethod
+    def backoff(attempt):
+        time.sleep(random.uniform(0, 2 ** attempt))
+
+    # Send a request, returning the successful response (None on failure) and any warnings raised
+    def request(self, method, url, **kwargs):
+        warnings = []
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                metrics.increment("backend_retries_total", backend=self.name)
+            rejected = self.admit()
+            if rejected is not None:
+                warnings.append(rejected)
+                break
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                metrics.observe("backend_request_seconds", time.perf_counter() - start, backend=self.name, status=response.status_code)
+                # Check if response is OK before handing it back
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response, warnings
+                elif response.status_code in RETRY_STATUSES:
+                    self.breaker.record_failure()
+                    if attempt < self.max_retries - 1:
+                        self.backoff(attempt)
+                    else:
+                        warnings.append(f"{self.name} API remained busy after all retries.")
+                else:
+                    self.breaker.record_success() # the backend answered, the request itself was refused
+                    warnings.append(f"{self.name} API status: {response.status_code}")
+                    break
+            except requests.exceptions.Timeout:
+                metrics.observe("backend_request_seconds", time.perf_counter() - start, backend=self.name, status="timeout")
+                self.breaker.record_failure()
+                if attempt < self.max_retries - 1:
+                    self.backoff(attempt)
+                else:
+                    warnings.append(f"{self.name} request timed out after all retries.")
+            except Exception as e:
+                metrics.observe("backend_request_seconds", time.perf_counter() - start, backend=self.name, status="error")
+                self.breaker.record_failure()
+                warnings.append(f"{self.name} API error: {e}")
+                break
+        return None, warnings
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    # Circuit state and rejection counts, for the diagnostics
+    def stats(self):
+        return {"circuit_open": int(self.breaker.state != "closed"), "consecutive_failures": self.breaker.failures}
+
+
+# Define function to read a backend's rate limit (requests per second) from the environment, 0 turns the limit off
+def rate_limit(variable, default):
+    return float(os.environ.get(variable, default)) or None
+
+# Define the clients shared by every session in the process
+# The default rate limits follow the public services' usage policies (Nominatim allows at most one request per second)
+weather_client = BackendClient("Weather", timeout=10, max_retries=1, rate_limit=rate_limit("OPENWEATHERMAP_RATE_LIMIT", 1), burst=5)
+overpass_client = BackendClient("Overpass", timeout=30, max_retries=3, rate_limit=rate_limit("OVERPASS_RATE_LIMIT", 2), burst=4)
+nominatim_client = BackendClient("Nominatim", timeout=10, max_retries=1, rate_limit=rate_limit("NOMINATIM_RATE_LIMIT", 1), burst=1)
+for client in (weather_client, overpass_client, nominatim_client):
+    metrics.register_collector(f"backend_{client.name.lower()}", client.stats)
@@ -0,0 +1,198 @@
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from fast_inference import compile_model
+from caching import TTLCache
+from enrichment import COORD_PRECISION, executor, query_osm
+from weather import weather_features, weather_provider
+from predictor import FeatureLayout, load_feature_order, load_model_file
+from timezones import get_resolver, local_time_features as local_time_features_utc
+
+# Size in degrees of the grid cell that rows share a weather lookup in (0.1 degrees is about 11 km)
+WEATHER_CELL_SIZE = 0.1
+
+# OpenWeatherMap only reports current conditions, so looked up weather is only given to rows timestamped within this long of the time of scoring
+# Older (or later) rows are left unscored unless the input has weather columns
+CURRENT_WEATHER_WINDOW = pd.Timedelta(hours=1)
+
+# Weather features the model was trained on, in the units produced by weather_features
+WEATHER_COLUMNS = ["Temperature(F)", "Pressure(in)", "Visibility(mi)", "Humidity(%)", "Wind_Speed(mph)"]
+
+# Number of rows read, enriched and scored at a time
+CHUNK_SIZE = 50000
+
+# Define function to read the input file in chunks so memory stays bounded regardless of file size
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq # only needed for Parquet input
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+# Define a writer that appends scored chunks to a CSV or Parquet output file
+class ChunkWriter:
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._first = True
+
+    def write(self, chunk):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=self._writer.schema, preserve_index=False) # keep every chunk on the first chunk's schema
+            self._writer.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+# Define function to look up each distinct key once, concurrently, reusing earlier results held in the cache
+# A lookup that raises gives its key the failed value instead of stopping the run
+# Failed lookups (those cacheable rejects) are not cached so a later chunk tries them again
+def lookup_unique(keys, fetch, cache, cacheable=lambda value: value is not None, failed=None):
+    results = {}
+    missing = []
+    for key in keys:
+        found, value = cache.get(key)
+        if found:
+            results[key] = value
+        else:
+            missing.append(key)
+    futures = {key: executor.submit(fetch, key) for key in missing}
+    errors = []
+    for key, future in futures.items():
+        try:
+            value = future.result()
+        except Exception as e:
+            errors.append(e)
+            value = failed
+        results[key] = value
+        if cacheable(value):
+            cache.set(key, value)
+    if errors:
+        print(f"{len(errors)} lookups failed, leaving their rows unscored (first error: {errors[0]!r})")
+    return results
+
+# Define function to parse the timestamp column, NaT where a timestamp is missing or cannot be parsed
+# Timestamps without a UTC offset are kept as naive local times; when any has an offset they are all read as UTC times
+def parse_times(timestamps):
+    try:
+        parsed = pd.to_datetime(timestamps, format="ISO8601", errors="coerce")
+    except ValueError: # mixed UTC offsets
+        parsed = None
+    if parsed is not None and pd.api.types.is_datetime64_dtype(parsed.dtype):
+        return parsed
+    return pd.to_datetime(timestamps, format="ISO8601", utc=True, errors="coerce")
+
+# Define function to derive the local month, day of week and hour of each row from its parsed timestamp
+# Naive timestamps are taken as local time already; UTC ones are converted into the timezone of the location
+def local_time_features(lats, lons, parsed):
+    if parsed.dt.tz is None:
+        return parsed.dt.month.to_numpy(), parsed.dt.dayofweek.to_numpy(), parsed.dt.hour.to_numpy()
+    return local_time_features_utc(parsed, get_resolver().timezones_at(lats, lons))
+
+# Define function to read the parsed timestamps as UTC times, taking naive ones as local time at the location (NaT where its timezone is unknown)
+def utc_times(lats, lons, parsed):
+    if parsed.dt.tz is not None:
+        return parsed
+    utc = pd.Series(pd.NaT, index=parsed.index, dtype="datetime64[ns, UTC]")
+    timezone_names = pd.Series(get_resolver().timezones_at(lats, lons), index=parsed.index)
+    for timezone_str, rows in timezone_names.groupby(timezone_names).groups.items():
+        utc[rows] = parsed[rows].dt.tz_localize(timezone_str, ambiguous="NaT", nonexistent="NaT").dt.tz_convert("UTC")
+    return utc
+
+
+# Define function to enrich and score one chunk of rows
+# Features are gathered by name and written into the layout's float32 buffer in the model's column order
+def predict_chunk(chunk, model, layout, args, caches):
+    lats = chunk[args.lat_column].to_numpy(dtype=np.float64)
+    lons = chunk[args.lon_column].to_numpy(dtype=np.float64)
+    # Time features, from the timestamp column if there is one, otherwise the time of scoring like the app
+    timestamps = chunk[args.time_column] if args.time_column in chunk else pd.Series(datetime.now(timezone.utc).isoformat(), index=chunk.index)
+    parsed = parse_times(timestamps)
+    months, days, hours = local_time_features(lats, lons, parsed)
+    features = {"Start_Month": months, "Start_Day": days, "Start_Hour": hours, "Start_Lat": lats, "Start_Lng": lons}
+    valid = parsed.notna().to_numpy(copy=True) # rows whose timestamp is missing or unparseable are left unscored
+    valid &= ~np.isnan(months) # as are rows with a UTC timestamp whose location has no known timezone
+
+    # Weather, from the input columns when the file already has them, otherwise the current weather looked up once per weather cell for the rows timestamped around now
+    if all(column in chunk for column in WEATHER_COLUMNS):
+        for column in WEATHER_COLUMNS:
+            features[column] = chunk[column].to_numpy(dtype=np.float64)
+    else:
+        now = pd.Timestamp.now(tz="UTC")
+        current = ((utc_times(lats, lons, parsed) - now).abs() <= CURRENT_WEATHER_WINDOW).to_numpy()
+        if not current.all():
+            print(f"{(~current).sum()} rows are not timestamped within {CURRENT_WEATHER_WINDOW.total_seconds() / 60:.0f} minutes of now and the input has no weather columns, leaving them unscored")
+        # Keyed on the current hour, since that is the weather the lookup returns whatever the row's timestamp
+        keys = list(zip(np.round(lats / WEATHER_CELL_SIZE).astype(np.int64), np.round(lons / WEATHER_CELL_SIZE).astype(np.int64), [now.floor("h").isoformat()] * len(chunk)))
+        weather = lookup_unique({key for key, is_current in zip(keys, current) if is_current}, lambda key: args.weather_provider.fetch(key[0] * WEATHER_CELL_SIZE, key[1] * WEATHER_CELL_SIZE)[0], caches["weather"])
+        rows = [weather_features(weather[key]) if is_current and weather[key] else dict.fromkeys(WEATHER_COLUMNS, np.nan) for key, is_current in zip(keys, current)]
+        weather = pd.DataFrame(rows, columns=WEATHER_COLUMNS).to_numpy(dtype=np.float64)
+        features.update(zip(WEATHER_COLUMNS, weather.T))
+        valid &= ~np.isnan(weather).any(axis=1)
+
+    # Traffic signal presence, from the input column when the file already has it, otherwise one Overpass/index lookup per rounded location that also confirms the location is a road
+    if "Traffic_Signal" in chunk:
+        features["Traffic_Signal"] = chunk["Traffic_Signal"].astype(bool).to_numpy()
+    else:
+        keys = list(zip(np.round(lats, COORD_PRECISION), np.round(lons, COORD_PRECISION)))
+        osm = lookup_unique(set(keys), lambda key: query_osm(*key)[:2], caches["osm"], lambda value: value[0] is not None, failed=(None, None))
+        features["Traffic_Signal"] = [bool(osm[key][0] and osm[key][0]['elements']) for key in keys]
+        chunk["Is_Road"] = [bool(osm[key][1] and osm[key][1]['elements']) for key in keys]
+        valid &= chunk["Is_Road"].to_numpy()
+
+    # Generate predictions for every scorable row in a single call
+    severity = pd.Series(pd.NA, index=chunk.index, dtype="Int64")
+    if valid.any():
+        severity[valid] = layout.predict(model, layout.fill(features, len(chunk))[valid])
+    chunk["Severity"] = severity
+    return chunk
+
+
+# Define function to score an input file and stream the results to the output file
+def run_batch(args):
+    model = compile_model(load_model_file(args.model))
+    args.weather_provider = weather_provider(args.owm_key)
+    layout = FeatureLayout(load_feature_order(args.features))
+    # Lookups are shared across chunks so rows later in the file reuse earlier answers
+    caches = {"weather": TTLCache(max_entries=100000, ttl=60*60), "osm": TTLCache(max_entries=500000, ttl=24*60*60)}
+    writer = ChunkWriter(args.output)
+    rows = 0
+    start_time = time.perf_counter()
+    try:
+        for chunk in read_chunks(args.input, args.chunk_size):
+            writer.write(predict_chunk(chunk, model, layout, args, caches))
+            rows += len(chunk)
+            print(f"Scored {rows} rows ({rows / (time.perf_counter() - start_time):.0f} rows/s)")
+    finally:
+        writer.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of accident locations with the traffic impact model.")
+    parser.add_argument("input", help="CSV or Parquet file with latitude, longitude and (optionally) timestamp columns")
+    parser.add_argument("output", help="CSV or Parquet file to write the input rows and predicted Severity to")
+    parser.add_argument("--model", default="applet_model.pkl", help="pickled model file")
+    parser.add_argument("--features", default="model_features.csv", help="model feature order file")
+    parser.add_argument("--lat-column", default="Start_Lat")
+    parser.add_argument("--lon-column", default="Start_Lng")
+    parser.add_argument("--time-column", default="Start_Time")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--owm-key", default=os.environ.get("OWM_API_KEY"), help="OpenWeatherMap API key, needed unless the input has weather columns (only current weather can be looked up)")
+    run_batch(parser.parse_args())
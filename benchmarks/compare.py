@@ -0,0 +1,60 @@
+import argparse
+import json
+
+# Measurements compared between runs, as (workload, path within the workload); throughput regresses when it falls, everything else when it rises
+COMPARED = [
+    ("model_load", ("cold", "download")),
+    ("model_load", ("cold", "deserialize")),
+    ("model_load", ("warm", "deserialize")),
+    ("model_load", ("compile",)),
+    ("timezone_grid", ("build",)),
+]
+for workload in ("single_click", "rerun", "batch", "heatmap"):
+    COMPARED += [
+        (workload, ("latency", "p50")),
+        (workload, ("latency", "p95")),
+        (workload, ("latency", "p99")),
+        (workload, ("throughput_per_s",)),
+        (workload, ("memory", "peak_rss_mb")),
+    ]
+
+
+def lookup(results, workload, path):
+    value = results["workloads"].get(workload)
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+# Define function to compare two benchmark results, returning one row per measurement with its relative change and whether it regressed
+def compare(before, after, threshold=0.10):
+    rows = []
+    for workload, path in COMPARED:
+        old, new = lookup(before, workload, path), lookup(after, workload, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if path[-1] == "throughput_per_s" else change
+        rows.append({"measurement": ".".join((workload,) + path), "before": old, "after": new, "change": change, "regressed": worse > threshold})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark results and flag regressions.")
+    parser.add_argument("before", help="results file of the baseline run")
+    parser.add_argument("after", help="results file of the new run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+    if before["config"] != after["config"]:
+        print("Warning: the runs used different configurations, the comparison may not be meaningful.")
+    rows = compare(before, after, args.threshold)
+    for row in rows:
+        print(f"{row['measurement']:<36} {row['before']:12.4f} {row['after']:12.4f} {row['change']:+8.1%}{'  REGRESSED' if row['regressed'] else ''}")
+    regressions = sum(row["regressed"] for row in rows)
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    raise SystemExit(1 if regressions else 0)
@@ -0,0 +1,52 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# Modules the app imports at startup, followed by the heavy libraries it defers until they are needed
+APP_MODULES = ["streamlit", "streamlit_folium", "folium", "numpy", "pandas", "caching", "instrumentation", "backends", "spatial_index", "weather", "enrichment", "timezones", "predictor", "prediction_log", "model_store", "fast_inference"]
+DEFERRED_MODULES = ["sklearn", "xgboost", "joblib", "geopy.geocoders", "timezonefinder", "gdown"]
+
+
+# Define function to import modules in a fresh interpreter with -X importtime, returning the cumulative seconds of each top-level import
+# Modules already imported by an earlier entry are not counted again, so importing them in order splits the startup cost between them
+def import_times(modules):
+    code = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() in modules and name.startswith(" ") and not name.startswith("  "):
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+# Define function to time each module on its own, each in a fresh interpreter
+def isolated_import_times(modules):
+    return {module: import_times([module]).get(module) for module in modules}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of the app's modules and of the libraries it loads lazily.")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the fastest is kept")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    args = parser.parse_args()
+    startup = [import_times(APP_MODULES) for _ in range(args.repeat)]
+    startup = {module: min(run.get(module, 0.0) for run in startup) for module in APP_MODULES}
+    deferred = [isolated_import_times(DEFERRED_MODULES) for _ in range(args.repeat)]
+    deferred = {module: min(run[module] for run in deferred if run[module] is not None) for module in DEFERRED_MODULES}
+    print("App startup imports (in import order, shared dependencies counted once):")
+    for module, seconds in startup.items():
+        print(f"  {module:<18} {seconds * 1000:8.1f} ms")
+    print(f"  {'total':<18} {sum(startup.values()) * 1000:8.1f} ms")
+    print("Deferred imports (each in a fresh interpreter):")
+    for module, seconds in deferred.items():
+        print(f"  {module:<18} {seconds * 1000:8.1f} ms")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"startup": startup, "deferred": deferred}, file, indent=2)
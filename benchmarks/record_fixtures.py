@@ -0,0 +1,41 @@
+import argparse
+import json
+import os
+import requests
+from standin import FIXTURES_DIR, HEATMAP_BOUNDS
+
+# Re-record the fixtures replayed by the stand-in server from the live backends, for one location and the map view of the heatmap workload
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record live Nominatim, OpenWeatherMap and Overpass responses as benchmark fixtures.")
+    parser.add_argument("--lat", type=float, default=35.2286)
+    parser.add_argument("--lon", type=float, default=-80.8348)
+    parser.add_argument("--owm-key", default=os.environ.get("OWM_API_KEY"), help="OpenWeatherMap API key")
+    args = parser.parse_args()
+    headers = {"User-Agent": "accident_input"}
+    query = f"""
+    [out:json][timeout:60];
+    node["highway"="traffic_signals"](around:400,{args.lat},{args.lon});
+    out ids;
+    way["highway"](around:15,{args.lat},{args.lon});
+    out ids;
+    """
+    south, west, north, east = HEATMAP_BOUNDS
+    viewport_query = f"""
+    [out:json][timeout:25];
+    node["highway"="traffic_signals"]({south},{west},{north},{east});
+    out skel qt;
+    way["highway"]({south},{west},{north},{east});
+    out geom qt;
+    """
+    recordings = {
+        "nominatim_reverse.json": requests.get("https://nominatim.openstreetmap.org/reverse", params={"lat": args.lat, "lon": args.lon, "format": "json", "addressdetails": 1}, headers=headers, timeout=30),
+        "openweathermap_weather.json": requests.get("https://api.openweathermap.org/data/2.5/weather", params={"lat": args.lat, "lon": args.lon, "appid": args.owm_key, "units": "imperial"}, timeout=30),
+        "overpass_interpreter.json": requests.post("https://overpass-api.de/api/interpreter", data=query, headers=headers, timeout=90),
+        "overpass_viewport.json": requests.post("https://overpass-api.de/api/interpreter", data=viewport_query, headers=headers, timeout=90),
+    }
+    for fixture, response in recordings.items():
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, fixture), "w") as file:
+            json.dump(response.json(), file, indent=2)
+            file.write("\n")
+        print(f"Recorded {fixture}")
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+from standin import HEATMAP_BOUNDS, StandInServer, parse_service_values
+
+# Directory the results of each run are saved to, one JSON file per run
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Area the benchmark locations are drawn from (the continental US)
+POINT_BOUNDS = (25.0, -124.0, 49.0, -67.0) # min lat, min lon, max lat, max lon
+
+# File id the model is stored under, served by the stand-in in place of Google Drive
+MODEL_FILE_ID = "benchmark-model"
+
+
+# Define function to build a model shaped like the app's (a soft VotingClassifier of a random forest and XGBoost over the model features) when no model file is given
+def synthetic_model(feature_order, seed=0):
+    from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+    from xgboost import XGBClassifier
+    rng = np.random.default_rng(seed)
+    rows = pd.DataFrame(rng.random((5000, len(feature_order))), columns=feature_order)
+    severity = 1 + np.digitize(rows.sum(axis=1) + rng.normal(0, 0.5, len(rows)), np.quantile(rows.sum(axis=1), [0.25, 0.5, 0.75]))
+    model = VotingClassifier([
+        ("rf", RandomForestClassifier(n_estimators=100, max_depth=12, random_state=seed)),
+        ("xgb", XGBClassifier(n_estimators=100, max_depth=6, random_state=seed)),
+    ], voting="soft")
+    return model.fit(rows, severity)
+
+# Define function to draw the same benchmark locations for the same seed
+def sample_points(count, seed=0):
+    min_lat, min_lon, max_lat, max_lon = POINT_BOUNDS
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.uniform(min_lat, max_lat, count).round(6), rng.uniform(min_lon, max_lon, count).round(6)))
+
+# Define function to summarize latencies in seconds
+def latency_summary(seconds):
+    seconds = np.asarray(seconds, dtype=np.float64)
+    return {
+        "mean": float(seconds.mean()),
+        "p50": float(np.percentile(seconds, 50)),
+        "p95": float(np.percentile(seconds, 95)),
+        "p99": float(np.percentile(seconds, 99)),
+        "max": float(seconds.max()),
+    }
+
+# Define function to report the current and peak resident memory of the process in MB
+def memory_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # reported in KB on Linux
+    try:
+        with open("/proc/self/statm") as file:
+            current = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        current = None
+    return {"rss_mb": current, "peak_rss_mb": peak}
+
+
+# Define function to run one workload, returning its latency, throughput, memory and the backend requests it made
+# run returns the latency of each operation and the number of locations it scored; operations is the number of locations asked for (None when that is only known once the workload has run, throughput then counts the scored ones)
+def measure(server, metrics, operations, run):
+    metrics.reset()
+    server.reset_counts()
+    start = time.perf_counter()
+    latencies, scored = run()
+    elapsed = time.perf_counter() - start
+    locations = operations if operations is not None else scored
+    return {
+        "operations": len(latencies),
+        "locations": locations,
+        "scored": scored,
+        "seconds": elapsed,
+        "throughput_per_s": locations / elapsed,
+        "latency": latency_summary(latencies),
+        "memory": memory_mb(),
+        "backend_requests": server.request_counts(),
+        "stages": metrics.summary(),
+    }
+
+
+def run_benchmarks(args):
+    server = StandInServer(
+        latency=parse_service_values(args.latency, args.latency_ms, scale=0.001),
+        error_rate=parse_service_values(args.errors, args.error_rate),
+        seed=args.seed,
+    ).start()
+    # The backend URLs are read when the pipeline modules are imported, so point them at the stand-in first
+    os.environ.update(server.environ())
+    os.environ["OSM_INDEX_DIR"] = args.osm_index or os.path.join(tempfile.gettempdir(), "no-osm-index")
+    os.environ.pop("WEATHER_PROVIDER_FILE", None)
+    # The public services' rate limits would dominate every workload, so they are off unless asked for
+    if not args.rate_limits:
+        os.environ.update({"NOMINATIM_RATE_LIMIT": "0", "OPENWEATHERMAP_RATE_LIMIT": "0", "OVERPASS_RATE_LIMIT": "0"})
+
+    from caching import TTLCache
+    from fast_inference import compile_model
+    from grid_scoring import score_viewport
+    from instrumentation import metrics
+    from model_store import load_model
+    from predictor import FeatureLayout, Predictor, load_feature_order
+    from timezones import get_resolver
+    from weather import OpenWeatherMapProvider, WeatherCache
+
+    feature_order_path = os.path.join(REPO_DIR, "model_features.csv")
+    if args.model:
+        with open(args.model, 'rb') as file:
+            server.responses["gdrive"] = file.read()
+    else:
+        server.responses["gdrive"] = pickle.dumps(synthetic_model(load_feature_order(feature_order_path), seed=args.seed))
+
+    results = {
+        "label": args.label,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "config": {
+            "model": args.model or "synthetic",
+            "heatmap_roads": server.viewport_source, # recorded Overpass response, or the synthetic street grid
+            "seed": args.seed,
+            "clicks": args.clicks,
+            "reruns": args.reruns,
+            "batch_size": args.batch_size,
+            "heatmaps": args.heatmaps,
+            "latency_s": server.latency,
+            "error_rate": server.error_rate,
+            "rate_limits": args.rate_limits,
+        },
+        "workloads": {},
+    }
+    workloads = results["workloads"]
+
+    try:
+        # Model startup: a cold start downloads from the stand-in Google Drive, a warm start reuses the local store
+        with tempfile.TemporaryDirectory() as store_dir:
+            server.reset_counts()
+            _, cold = load_model(MODEL_FILE_ID, store_dir=store_dir)
+            model, warm = load_model(MODEL_FILE_ID, store_dir=store_dir)
+            workloads["model_load"] = {"cold": cold, "warm": warm, "backend_requests": server.request_counts(), "memory": memory_mb()}
+        start = time.perf_counter()
+        engine = compile_model(model)
+        workloads["model_load"]["compile"] = time.perf_counter() - start
+        start = time.perf_counter()
+        get_resolver()
+        workloads["timezone_grid"] = {"build": time.perf_counter() - start, "memory": memory_mb()}
+
+        feature_order = load_feature_order(feature_order_path)
+        def fresh_predictor():
+            return Predictor(engine, feature_order, TTLCache(max_entries=4096, ttl=15*60), WeatherCache(OpenWeatherMapProvider("benchmark")))
+
+        # Define function to handle one click the way the app does: enrich the location, then score it alone
+        def click(predictor, lat, lon):
+            start = time.perf_counter()
+            prepared = predictor.prepare(lat, lon)
+            if prepared.row is not None:
+                predictor.score([prepared])
+            return time.perf_counter() - start, prepared.row is not None
+
+        # Single click: every click is a new location, so every lookup goes to the backends
+        def single_click():
+            predictor = fresh_predictor()
+            timings = [click(predictor, lat, lon) for lat, lon in sample_points(args.clicks, args.seed)]
+            return [seconds for seconds, _ in timings], sum(scored for _, scored in timings)
+        workloads["single_click"] = measure(server, metrics, args.clicks, single_click)
+
+        # Rerun: the same location again and again, answered from the caches after the first click
+        def rerun():
+            predictor = fresh_predictor()
+            lat, lon = sample_points(1, args.seed + 1)[0]
+            timings = [click(predictor, lat, lon) for _ in range(args.reruns)]
+            return [seconds for seconds, _ in timings], sum(scored for _, scored in timings)
+        workloads["rerun"] = measure(server, metrics, args.reruns, rerun)
+
+        # Batch: many locations enriched concurrently and scored with one model call
+        def batch():
+            predictor = fresh_predictor()
+            start = time.perf_counter()
+            predictions = predictor.predict_many(sample_points(args.batch_size, args.seed + 2))
+            return [time.perf_counter() - start], sum(prediction["severity"] is not None for prediction in predictions)
+        workloads["batch"] = measure(server, metrics, args.batch_size, batch)
+
+        # Heatmap: the same map view scored repeatedly, the first time fetching its roads and signals, later times reusing them and the weather
+        def heatmap():
+            layout = FeatureLayout(feature_order)
+            road_cache = TTLCache(max_entries=32, ttl=60*60)
+            weather_cache = WeatherCache(OpenWeatherMapProvider("benchmark"))
+            latencies, scored = [], 0
+            for _ in range(args.heatmaps):
+                start = time.perf_counter()
+                results, _, _ = score_viewport(list(HEATMAP_BOUNDS), engine, layout, weather_cache, road_cache)
+                latencies.append(time.perf_counter() - start)
+                scored += len(results)
+            return latencies, scored
+        workloads["heatmap"] = measure(server, metrics, None, heatmap)
+    finally:
+        server.stop()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{args.label}.json")
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    return results, path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the prediction pipeline against backend fixture responses served locally.")
+    parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d-%H%M%S"), help="name of the results file")
+    parser.add_argument("--model", help="pickled model file (otherwise a synthetic model with the app's structure is trained)")
+    parser.add_argument("--osm-index", help="offline OSM index directory (otherwise Overpass requests go to the stand-in)")
+    parser.add_argument("--clicks", type=int, default=50, help="locations in the single click workload")
+    parser.add_argument("--reruns", type=int, default=200, help="repeats of one location in the rerun workload")
+    parser.add_argument("--batch-size", type=int, default=500, help="locations in the batch workload")
+    parser.add_argument("--heatmaps", type=int, default=5, help="times the map view is scored in the heatmap workload")
+    parser.add_argument("--latency-ms", type=float, default=50, help="latency added to every stand-in response")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MS", help="latency for one service (nominatim, openweathermap, overpass, gdrive), overriding --latency-ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stand-in requests answered with a 504")
+    parser.add_argument("--errors", action="append", metavar="SERVICE=RATE", help="504 rate for one service, overriding --error-rate")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the client rate limits of the public services")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    results, path = run_benchmarks(args)
+    for name in ("single_click", "rerun", "batch", "heatmap"):
+        workload = results["workloads"][name]
+        print(f"{name:<13} p50 {workload['latency']['p50'] * 1000:9.1f} ms   p95 {workload['latency']['p95'] * 1000:9.1f} ms   "
+              f"{workload['throughput_per_s']:8.1f} locations/s   {workload['scored']}/{workload['locations']} scored")
+    print(f"Results saved to {path}")
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Directory holding the backend responses replayed by the stand-in server (hand-written examples until record_fixtures.py records live ones)
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Path served for each backend and the fixture file it replays (the Google Drive model is served from memory instead)
+ROUTES = {
+    "/reverse": ("nominatim", "nominatim_reverse.json"),
+    "/data/2.5/weather": ("openweathermap", "openweathermap_weather.json"),
+    "/api/interpreter": ("overpass", "overpass_interpreter.json"),
+    "/uc": ("gdrive", None),
+}
+SERVICES = [service for service, _ in ROUTES.values()]
+
+# Overpass queries for the road geometry of a box (map view scoring, "out geom") replay this fixture instead once it has been recorded with record_fixtures.py
+# Until then they are answered with a synthetic street grid over HEATMAP_BOUNDS, generated when the server starts
+OVERPASS_VIEWPORT_FIXTURE = "overpass_viewport.json"
+
+# Map view scored by the heatmap workload (downtown Charlotte) and recorded by record_fixtures.py
+HEATMAP_BOUNDS = (35.19, -80.91, 35.31, -80.79) # min lat, min lon, max lat, max lon
+
+
+# Define function to generate an Overpass "out geom" response for a box that is not OpenStreetMap data: a grid of slightly wavy streets every spacing degrees, with traffic signals at a share of the crossings
+# The response is labelled as synthetic in its generator field
+def synthetic_viewport(bounds, spacing=0.005, signal_share=0.15, seed=0):
+    rng = random.Random(seed)
+    south, west, north, east = bounds
+    lats = [south + spacing * (i + 0.5) for i in range(round((north - south) / spacing))]
+    lons = [west + spacing * (i + 0.5) for i in range(round((east - west) / spacing))]
+    elements = []
+    for lat in lats:
+        geometry = [{"lat": round(lat + rng.uniform(-0.0003, 0.0003), 7), "lon": round(lon, 7)} for lon in [west] + lons + [east]]
+        elements.append({"type": "way", "id": len(elements) + 1, "geometry": geometry, "tags": {"highway": "residential"}})
+    for lon in lons:
+        geometry = [{"lat": round(lat, 7), "lon": round(lon + rng.uniform(-0.0003, 0.0003), 7)} for lat in [south] + lats + [north]]
+        elements.append({"type": "way", "id": len(elements) + 1, "geometry": geometry, "tags": {"highway": "residential"}})
+    for lat in lats:
+        for lon in lons:
+            if rng.random() < signal_share:
+                elements.append({"type": "node", "id": len(elements) + 1, "lat": round(lat, 7), "lon": round(lon, 7)})
+    return {"version": 0.6, "generator": "synthetic street grid (benchmarks/standin.py), not OpenStreetMap data", "elements": elements}
+
+
+# Define the local stand-in for Nominatim, OpenWeatherMap, Overpass and Google Drive
+# Every request waits for its service's injected latency, then fails with a 504 at the service's error rate or replays the fixture response
+class StandInServer:
+    def __init__(self, fixtures_dir=FIXTURES_DIR, model_bytes=b"", latency=None, error_rate=None, seed=0, host="127.0.0.1", port=0):
+        self.responses = {}
+        for service, fixture in ROUTES.values():
+            if fixture is not None:
+                with open(os.path.join(fixtures_dir, fixture), 'rb') as file:
+                    self.responses[service] = file.read()
+        viewport_path = os.path.join(fixtures_dir, OVERPASS_VIEWPORT_FIXTURE)
+        self.viewport_source = "recorded" if os.path.exists(viewport_path) else "synthetic"
+        if self.viewport_source == "recorded":
+            with open(viewport_path, 'rb') as file:
+                self.responses["overpass_viewport"] = file.read()
+        else:
+            self.responses["overpass_viewport"] = json.dumps(synthetic_viewport(HEATMAP_BOUNDS)).encode()
+        self.responses["gdrive"] = model_bytes
+        self.latency = {service: 0.0 for service in SERVICES} # seconds added before each response
+        self.latency.update(latency or {})
+        self.error_rate = {service: 0.0 for service in SERVICES} # share of requests answered with a 504
+        self.error_rate.update(error_rate or {})
+        self.requests = Counter() # (service, status) -> count
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Environment variables that point the pipeline at this server instead of the live backends
+    def environ(self):
+        return {
+            "NOMINATIM_URL": self.url,
+            "OPENWEATHERMAP_URL": f"{self.url}/data/2.5/weather",
+            "OVERPASS_URL": f"{self.url}/api/interpreter",
+            "GDRIVE_URL": self.url,
+        }
+
+    # Decide the status of the next request to a service, the same sequence is drawn for the same seed
+    def _status(self, service):
+        with self._lock:
+            status = 504 if self._random.random() < self.error_rate[service] else 200
+            self.requests[(service, status)] += 1
+        return status
+
+    def request_counts(self):
+        with self._lock:
+            return {f"{service}:{status}": count for (service, status), count in sorted(self.requests.items())}
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                route = ROUTES.get(urlsplit(self.path).path)
+                length = int(self.headers.get("Content-Length") or 0)
+                query = self.rfile.read(length) if length else b""
+                if route is None:
+                    self.send_error(404)
+                    return
+                service = route[0]
+                time.sleep(server.latency[service])
+                if server._status(service) == 504:
+                    body = b"Gateway Timeout"
+                    self.send_response(504)
+                    self.send_header("Content-Type", "text/plain")
+                else:
+                    body = server.responses["overpass_viewport" if service == "overpass" and b"out geom" in query else service]
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream" if service == "gdrive" else "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Define function to parse per-service settings given as SERVICE=VALUE, applying a default to the services not named
+def parse_service_values(values, default, scale=1.0):
+    settings = {service: default * scale for service in SERVICES}
+    for value in values or []:
+        service, _, number = value.partition("=")
+        if service not in settings:
+            raise ValueError(f"Unknown service {service!r}, expected one of {', '.join(SERVICES)}")
+        settings[service] = float(number) * scale
+    return settings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the backend fixtures locally with injected latency and 504 errors.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", help="model file served as the Google Drive download")
+    parser.add_argument("--latency-ms", type=float, default=50, help="latency added to every response")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MS", help="latency for one service, overriding --latency-ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 504")
+    parser.add_argument("--errors", action="append", metavar="SERVICE=RATE", help="504 rate for one service, overriding --error-rate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    model_bytes = b""
+    if args.model:
+        with open(args.model, 'rb') as file:
+            model_bytes = file.read()
+    server = StandInServer(
+        model_bytes=model_bytes,
+        latency=parse_service_values(args.latency, args.latency_ms, scale=0.001),
+        error_rate=parse_service_values(args.errors, args.error_rate),
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    for name, value in server.environ().items():
+        print(f"export {name}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.request_counts(), indent=2))
@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Define a bounded cache that evicts the least recently used entries and any entry older than ttl seconds
+class TTLCache:
+    def __init__(self, max_entries=512, ttl=900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (time stored, value), ordered from least to most recently used
+        self._lock = threading.Lock() # Streamlit serves each session from its own thread
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    # Return (True, value) for a fresh entry, otherwise (False, None); record=False leaves the hit/miss counters alone
+    def get(self, key, record=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += record
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key] # expired
+            self.misses += record
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,213 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from urllib.parse import urlsplit
+from backends import nominatim_client, overpass_client, weather_client
+from caching import TTLCache
+from spatial_index import load_index
+from instrumentation import metrics
+
+# Number of decimal places used to round lat/lon when building cache keys (4 places is roughly 11 m)
+COORD_PRECISION = 4
+
+# Message returned by reverse_geocode when the Nominatim request fails
+GEOCODE_ERROR = "Error: An unexpected error occurred. Please try again."
+
+# Define OSM's Overpass API URL (OVERPASS_URL points it elsewhere, such as the benchmark stand-in server)
+OVERPASS_URL = os.environ.get("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+
+# Define the Nominatim server used for reverse geocoding (NOMINATIM_URL points it elsewhere)
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+
+# Define the offline OSM index built by spatial_index.py, used instead of Overpass when present (None otherwise)
+osm_index = load_index(os.environ.get("OSM_INDEX_DIR", "osm_index"))
+
+# Define the worker threads used to run the lookups for a location concurrently, shared by all sessions
+executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="enrichment")
+
+# Define function to build the cache key for a location by rounding the lat/lon
+def location_key(lat, lon, precision=COORD_PRECISION):
+    return (round(lat, precision), round(lon, precision))
+
+
+# Define the geocoder the first time it is needed (geopy is only imported then) so every lookup reuses it
+@lru_cache(maxsize=None)
+def get_geolocator():
+    from geopy.geocoders import Nominatim
+    nominatim_url = urlsplit(NOMINATIM_URL)
+    return Nominatim(user_agent="accident_input", domain=nominatim_url.netloc + nominatim_url.path.rstrip("/"), scheme=nominatim_url.scheme)
+
+# Longest each lookup can take, including retries and backoff
+LOOKUP_BUDGETS = {
+    "geocode": nominatim_client.budget,
+    "weather": weather_client.budget,
+    "osm": overpass_client.budget,
+}
+
+# Define function to reverse geocode (get address from lat/lng)
+# geopy makes the request itself, the Nominatim client supplies the shared rate limit and circuit breaker
+def reverse_geocode(lat, lon):
+    if nominatim_client.admit() is not None:
+        return GEOCODE_ERROR
+    with metrics.timer("backend_request_seconds", backend="Nominatim") as labels:
+        try:
+            location = get_geolocator().reverse((lat, lon), exactly_one=True, timeout=nominatim_client.timeout)
+            labels["status"] = "ok"
+            nominatim_client.breaker.record_success()
+            if location:
+                return location.raw['address']
+            else:
+                return None
+        except Exception as e: # Handle errors
+            labels["status"] = e.__class__.__name__
+            nominatim_client.breaker.record_failure()
+            return GEOCODE_ERROR
+
+# Define function to check for traffic signals within 400 meters (about 1/4 mile) and roads within 15 meters (about 50 feet) of the selected accident location
+# Locations covered by the offline OSM index are answered locally, anything else falls back to the live Overpass API
+# Both checks are answered by one Overpass request: signals come back as nodes and roads as ways, so the element type tags which result set each belongs to
+# Returns the signal and road results in the {'elements': [...]} shape of an Overpass response (None on failure) and any warnings raised
+def query_osm(lat, lon):
+    if osm_index is not None and osm_index.covers(lat, lon):
+        with metrics.timer("stage_seconds", stage="osm_index"):
+            return osm_index.traffic_presence(lat, lon), osm_index.roads_presence(lat, lon), []
+    query = f"""
+    [out:json][timeout:60];
+    node["highway"="traffic_signals"](around:400,{lat},{lon});
+    out ids;
+    way["highway"](around:15,{lat},{lon});
+    out ids;
+    """
+    response, warnings = overpass_client.post(OVERPASS_URL, data=query)
+    if response is None:
+        return None, None, warnings
+    elements = response.json()['elements']
+    traffic_presence = {'elements': [element for element in elements if element['type'] == 'node']}
+    roads_presence = {'elements': [element for element in elements if element['type'] == 'way']}
+    return traffic_presence, roads_presence, warnings
+
+
+# Define the result of enriching a single clicked location
+@dataclass(frozen=True)
+class LocationEnrichment:
+    lat: float
+    lon: float
+    geocode: object # address dict from Nominatim, None if no address was found, or the GEOCODE_ERROR message
+    weather_data: object = None # OpenWeatherMap response, None if it could not be retrieved
+    traffic_presence: object = None # Overpass response for nearby traffic signals, None if it could not be retrieved
+    roads_presence: object = None # Overpass response for nearby roads, None if it could not be retrieved
+    warnings: tuple = () # status messages raised by the backends
+    geocoded: bool = True # False when the address lookup was skipped (geocode is then None)
+
+    # An empty set returned from the OSM query implies no traffic signals within the 1/4 mile radius
+    @property
+    def traffic_signal(self):
+        return bool(self.traffic_presence and self.traffic_presence['elements'])
+
+    # An empty set returned from the OSM query implies that the selected location is not within 50 feet of a road
+    @property
+    def is_road(self):
+        return bool(self.roads_presence and self.roads_presence['elements'])
+
+    # True when the lookups that depend only on the location (address, signals and roads) all answered, only those results are worth caching
+    @property
+    def location_complete(self):
+        return not self.geocode_failed and self.traffic_presence is not None and self.roads_presence is not None
+
+    @property
+    def geocode_failed(self):
+        return isinstance(self.geocode, str) and "Error" in self.geocode
+
+    # Nearest address formatted for display
+    @property
+    def address(self):
+        if self.geocode_failed:
+            return self.geocode
+        elif not self.geocoded:
+            return None
+        elif self.geocode:
+            house_number = self.geocode.get('house_number')
+            street = self.geocode.get('road')
+            city = self.geocode.get('city')
+            state = self.geocode.get('state')
+            zipcode = self.geocode.get('postcode')
+            return f"{house_number} {street}, {city}, {state} {zipcode}"
+        else:
+            return "Address data could not be retrieved."
+
+
+# Define function to run a lookup and record how long it took
+def timed(stage, function, *args):
+    with metrics.timer("stage_seconds", stage=stage):
+        return function(*args)
+
+# Define function to run the geocode, weather and Overpass lookups for a location concurrently
+# Each lookup is bounded by its own timeout and retry budget, so the total wait is bounded by the slowest single backend
+# When the location lookups are already known only the weather is fetched, and without geocode the address is not looked up
+def fetch_enrichment(lat, lon, weather_cache, known=None, geocode=True):
+    futures = {"weather": executor.submit(timed, "weather", weather_cache.get, lat, lon)}
+    if known is None:
+        if geocode:
+            futures["geocode"] = executor.submit(timed, "geocode", reverse_geocode, lat, lon)
+        futures["osm"] = executor.submit(timed, "osm", query_osm, lat, lon)
+    # Lookups that fail or run past their budget fall back to the same values a failed request produces
+    results = {"geocode": GEOCODE_ERROR if geocode else None, "weather": (None, []), "osm": (None, None, [])}
+    warnings = []
+    start = time.monotonic()
+    for name, future in futures.items():
+        remaining = LOOKUP_BUDGETS[name] - (time.monotonic() - start)
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            metrics.increment("lookup_timeouts_total", stage=name)
+            warnings.append(f"{name.capitalize()} lookup did not finish in time.")
+        except Exception as e:
+            warnings.append(f"{name.capitalize()} lookup error: {e}")
+    weather_data, weather_warnings = results["weather"]
+    if known is not None:
+        return replace(known, lat=lat, lon=lon, weather_data=weather_data, warnings=tuple(warnings + weather_warnings))
+    traffic_presence, roads_presence, osm_warnings = results["osm"]
+    return LocationEnrichment(
+        lat=lat,
+        lon=lon,
+        geocode=results["geocode"],
+        weather_data=weather_data,
+        traffic_presence=traffic_presence,
+        roads_presence=roads_presence,
+        warnings=tuple(warnings + weather_warnings + osm_warnings),
+        geocoded=geocode,
+    )
+
+# Define the last complete address, signal and road results of each location, kept long after the enrichment cache lets them go
+# They stand in for lookups that fail while a backend is down or its circuit is open, so a location seen before can still be scored
+last_known = TTLCache(max_entries=4096, ttl=24*60*60)
+
+# Define function to enrich a location, looking up its address, signals and roads once and reusing them for any later request for the same rounded location
+# Weather comes from the weather cache on every call, so it refreshes on that cache's own schedule
+# Callers that do not need the address (such as the prediction service) pass geocode=False to skip the rate limited Nominatim lookup
+def enrich_location(lat, lon, cache, weather_cache, geocode=True):
+    key = location_key(lat, lon)
+    found, known = cache.get(key)
+    found = found and (known.geocoded or not geocode) # an entry stored without the address does not answer a caller that needs it
+    metrics.increment("location_cache_total", result="hit" if found else "miss")
+    enrichment = fetch_enrichment(lat, lon, weather_cache, known if found else None, geocode)
+    if found:
+        return enrichment
+    if enrichment.location_complete: # Partial results are not cached so the next rerun tries the failed lookups again
+        static = replace(enrichment, weather_data=None, warnings=())
+        cache.set(key, static)
+        last_known.set(key, static)
+        return enrichment
+    stale_found, stale = last_known.get(key)
+    if stale_found:
+        metrics.increment("location_fallback_total")
+        enrichment = replace(
+            enrichment,
+            geocode=stale.geocode if enrichment.geocode_failed else enrichment.geocode,
+            traffic_presence=stale.traffic_presence if enrichment.traffic_presence is None else enrichment.traffic_presence,
+            roads_presence=stale.roads_presence if enrichment.roads_presence is None else enrichment.roads_presence,
+            warnings=enrichment.warnings + ("Showing the last known address, signal and road results for this location.",),
+        )
+    return enrichment
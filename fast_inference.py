@@ -0,0 +1,168 @@
+import warnings
+import numpy as np
+import pandas as pd
+from instrumentation import metrics
+
+# Largest batch walked through the flattened node arrays; bigger batches are cheaper to send through each tree's compiled apply
+WALK_MAX_ROWS = 8
+
+
+# Define a random forest flattened into one set of node arrays covering every tree
+# Small batches walk all rows through all trees at once with NumPy; large batches find leaves with each tree's compiled apply, and both read the shared leaf value table
+class FlatForest:
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        self.trees = trees
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        left, right, feature, threshold, missing_left, value = [], [], [], [], [], []
+        for offset, tree in zip(offsets, trees):
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            # Leaves point back at themselves so walking past the bottom of a shallow tree leaves its rows in place
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            missing_left.append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8)).astype(bool))
+            # Leaf class distributions normalized the same way DecisionTreeClassifier.predict_proba does
+            leaf_value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = leaf_value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0] = 1
+            value.append(leaf_value / normalizer)
+        self.roots = offsets.astype(np.intp)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold)
+        self.missing_left = np.concatenate(missing_left)
+        self.value = np.concatenate(value)
+        self.depth = max(tree.max_depth for tree in trees)
+        self.classes_ = forest.classes_
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32) # scikit-learn trees compare float32 inputs against their thresholds
+        if len(X) > WALK_MAX_ROWS:
+            proba = np.zeros((len(X), self.value.shape[1]))
+            for offset, tree in zip(self.roots, self.trees):
+                proba += self.value[tree.apply(X) + offset]
+            return proba / len(self.roots)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.depth):
+            values = X[rows, self.feature[nodes]]
+            go_left = (values <= self.threshold[nodes]) | (np.isnan(values) & self.missing_left[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].sum(axis=1) / len(self.roots)
+
+
+# Define an XGBoost classifier evaluated straight through its native booster, skipping the scikit-learn wrapper
+class NativeBooster:
+    def __init__(self, classifier):
+        self.booster = classifier.get_booster()
+        self.classes_ = classifier.classes_
+        # Models trained with early stopping predict with the trees up to their best iteration, like XGBClassifier does
+        best_iteration = getattr(self.booster, "best_iteration", None)
+        self.iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+    def predict_proba(self, X):
+        proba = self.booster.inplace_predict(np.asarray(X, dtype=np.float32), iteration_range=self.iteration_range)
+        if proba.ndim == 1: # binary objectives return the probability of the positive class only
+            proba = np.column_stack([1 - proba, proba])
+        return proba
+
+
+# Define a stand-in for any other estimator, which keeps using its own predict_proba
+class EstimatorProba:
+    def __init__(self, estimator, feature_names):
+        self.estimator = estimator
+        self.feature_names = feature_names
+        self.classes_ = estimator.classes_
+
+    def predict_proba(self, X):
+        return self.estimator.predict_proba(pd.DataFrame(X, columns=self.feature_names))
+
+
+# Define function to choose the fast evaluator for each kind of estimator
+def compile_estimator(estimator, feature_names):
+    name = estimator.__class__.__name__
+    if name in ("RandomForestClassifier", "ExtraTreesClassifier") and getattr(estimator, "n_outputs_", 1) == 1:
+        return FlatForest(estimator)
+    if name == "XGBClassifier":
+        return NativeBooster(estimator)
+    return EstimatorProba(estimator, feature_names)
+
+
+# Define the compiled VotingClassifier, reproducing its hard or soft vote from the compiled estimators
+class FastVotingClassifier:
+    def __init__(self, model):
+        self.model = model
+        self.feature_names = list(model.feature_names_in_)
+        self.voting = model.voting
+        self.weights = None if model.weights is None else np.asarray([weight for weight in model.weights if weight is not None], dtype=np.float64)
+        self.classes_ = model.classes_
+        self.label_encoder = model.le_
+        self.estimators = [compile_estimator(estimator, self.feature_names) for estimator in model.estimators_]
+
+    # Accept a DataFrame in any column order, or an array already in the model's feature order
+    # The forests and the booster both compare float32 inputs, so a float32 array is used as-is without a copy
+    def _as_array(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_names]
+        return np.asarray(X, dtype=np.float32).reshape(-1, len(self.feature_names))
+
+    def predict_proba(self, X):
+        X = self._as_array(X)
+        return np.average([estimator.predict_proba(X) for estimator in self.estimators], axis=0, weights=self.weights)
+
+    def predict(self, X):
+        X = self._as_array(X)
+        if self.voting == "soft":
+            votes = self.predict_proba(X).argmax(axis=1)
+        else:
+            # Each estimator votes for its most likely class (in the encoded labels the VotingClassifier fitted them on), weighted like VotingClassifier does
+            n_classes = len(self.classes_)
+            predictions = np.column_stack([np.asarray(estimator.classes_).take(estimator.predict_proba(X).argmax(axis=1)) for estimator in self.estimators]).astype(np.intp)
+            weights = np.ones(predictions.shape[1]) if self.weights is None else self.weights
+            tally = np.zeros((len(X), n_classes))
+            for column in range(predictions.shape[1]):
+                np.add.at(tally, (np.arange(len(X)), predictions[:, column]), weights[column])
+            votes = tally.argmax(axis=1)
+        return self.label_encoder.inverse_transform(votes)
+
+
+# Define function to build probe rows spread across the split thresholds the forests use, for checking the compiled model
+def probe_rows(engine, count=512, seed=0):
+    rng = np.random.default_rng(seed)
+    low = np.zeros(len(engine.feature_names))
+    high = np.ones(len(engine.feature_names))
+    for estimator in engine.estimators:
+        if isinstance(estimator, FlatForest):
+            is_split = estimator.left != np.arange(len(estimator.left))
+            for column in range(len(low)):
+                thresholds = estimator.threshold[is_split & (estimator.feature == column)]
+                if len(thresholds):
+                    low[column] = min(low[column], thresholds.min())
+                    high[column] = max(high[column], thresholds.max())
+    margin = (high - low) * 0.1
+    return rng.uniform(low - margin, high + margin, size=(count, len(low)))
+
+# Define function to compile a VotingClassifier for fast inference
+# The compiled model is checked against the original on probe rows (or the rows given) and the original model is returned if they disagree
+# A fallback is counted in model_compile_total so it shows in the diagnostics (tests/test_fast_inference.py checks parity on fitted models)
+def compile_model(model, probe=None):
+    if model.__class__.__name__ != "VotingClassifier" or not hasattr(model, "feature_names_in_"):
+        return model
+    try:
+        engine = FastVotingClassifier(model)
+        probe = probe_rows(engine) if probe is None else engine._as_array(probe)
+        probe_frame = pd.DataFrame(probe, columns=engine.feature_names)
+        if not np.array_equal(engine.predict(probe), model.predict(probe_frame)):
+            raise ValueError("predictions differ from the original model")
+        if model.voting == "soft" and not np.allclose(engine.predict_proba(probe), model.predict_proba(probe_frame), rtol=1e-5, atol=1e-6):
+            raise ValueError("probabilities differ from the original model")
+    except Exception as e:
+        metrics.increment("model_compile_total", result="fallback")
+        warnings.warn(f"Fast inference disabled, using the original model: {e}")
+        return model
+    metrics.increment("model_compile_total", result="compiled")
+    return engine
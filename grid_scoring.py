@@ -0,0 +1,171 @@
+import math
+import time
+from concurrent.futures import wait
+import numpy as np
+import pandas as pd
+from backends import overpass_client
+from enrichment import OVERPASS_URL, executor, osm_index
+from instrumentation import metrics
+from predictor import INPUT_COLUMNS
+from spatial_index import METERS_PER_DEGREE, SIGNAL_RADIUS
+from timezones import get_resolver, local_time_features
+from weather import weather_features
+
+# Largest viewport scored at once, in degrees of latitude and of longitude (about 55 km north-south), when the offline OSM index covers it
+MAX_VIEWPORT_DEGREES = 0.5
+
+# Largest viewport scored from a live Overpass query (about 17 km north-south); every road geometry in a larger box routinely takes longer than the client timeout to return
+MAX_OVERPASS_VIEWPORT_DEGREES = 0.15
+
+# Default number of grid cells along each side of the viewport; each cell is scored at one road point
+CELLS_PER_SIDE = 40
+
+
+# Define function to read the viewport returned by st_folium ({'_southWest': {'lat', 'lng'}, '_northEast': {...}}) as [min_lat, min_lon, max_lat, max_lon]
+def viewport_bounds(bounds):
+    return [bounds["_southWest"]["lat"], bounds["_southWest"]["lng"], bounds["_northEast"]["lat"], bounds["_northEast"]["lng"]]
+
+# Define function to widen a box by a distance in meters on every side
+def pad_bounds(bounds, meters):
+    d_lat = meters / METERS_PER_DEGREE
+    d_lon = meters / (METERS_PER_DEGREE * max(math.cos(math.radians(max(abs(bounds[0]), abs(bounds[2])))), 1e-6))
+    return [bounds[0] - d_lat, bounds[1] - d_lon, bounds[2] + d_lat, bounds[3] + d_lon]
+
+
+# Define function to widen a box by the signal search radius, since signals just outside the viewport still count for road points near its edges
+def signal_bounds_of(bounds):
+    return pad_bounds(bounds, SIGNAL_RADIUS)
+
+# Define function to check whether the offline OSM index covers a box (and the signals around it)
+def index_covers(bounds):
+    signal_bounds = signal_bounds_of(bounds)
+    return osm_index is not None and osm_index.covers(signal_bounds[0], signal_bounds[1]) and osm_index.covers(signal_bounds[2], signal_bounds[3])
+
+# Define function to fetch the road segments and traffic signals of a box with one bulk lookup, instead of one Overpass request per point
+# The offline OSM index answers when it covers the box, otherwise a single Overpass request returns every signal node and road geometry in it
+# Elements missing their coordinates or geometry are skipped
+# Returns segments as (lat1, lon1, lat2, lon2) rows, signals as (lat, lon) rows (None for both on failure) and any warnings raised
+def fetch_roads_and_signals(bounds):
+    signal_bounds = signal_bounds_of(bounds)
+    if index_covers(bounds):
+        with metrics.timer("stage_seconds", stage="grid_osm_index"):
+            return osm_index.segments_in(bounds), osm_index.signals_in(signal_bounds), []
+    south, west, north, east = bounds
+    query = f"""
+    [out:json][timeout:25];
+    node["highway"="traffic_signals"]({signal_bounds[0]},{signal_bounds[1]},{signal_bounds[2]},{signal_bounds[3]});
+    out skel qt;
+    way["highway"]({south},{west},{north},{east});
+    out geom qt;
+    """
+    with metrics.timer("stage_seconds", stage="grid_osm"):
+        response, warnings = overpass_client.post(OVERPASS_URL, data=query)
+    if response is None:
+        return None, None, warnings
+    elements = response.json()['elements']
+    signals = np.array([(element['lat'], element['lon']) for element in elements if element.get('type') == 'node' and 'lat' in element and 'lon' in element], dtype=np.float64).reshape(-1, 2)
+    segments = []
+    for element in elements:
+        if element.get('type') == 'way':
+            geometry = [(point['lat'], point['lon']) for point in element.get('geometry') or [] if point and 'lat' in point and 'lon' in point]
+            segments.extend((start[0], start[1], end[0], end[1]) for start, end in zip(geometry, geometry[1:]))
+    return np.array(segments, dtype=np.float64).reshape(-1, 4), signals, warnings
+
+
+# Define function to pick one point on a road in each grid cell of the box, the road point nearest the cell's centre
+# Segments are sampled at intervals shorter than half a cell so no road crossing a cell is missed, all in NumPy
+def sample_road_points(segments, bounds, cells_per_side=CELLS_PER_SIDE):
+    if len(segments) == 0:
+        return np.empty((0, 2))
+    min_lat, min_lon, max_lat, max_lon = bounds
+    cell_lat = (max_lat - min_lat) / cells_per_side
+    cell_lon = (max_lon - min_lon) / cells_per_side
+    step = min(cell_lat, cell_lon) / 2
+    counts = np.maximum(np.ceil(np.maximum(np.abs(segments[:, 2] - segments[:, 0]), np.abs(segments[:, 3] - segments[:, 1])) / step).astype(np.int64), 1)
+    # Positions along each segment from 0 to 1, counts[i] + 1 of them for segment i
+    owners = np.repeat(np.arange(len(segments)), counts + 1)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(counts + 1) - (counts + 1), counts + 1)
+    t = offsets / counts[owners]
+    lats = segments[owners, 0] + t * (segments[owners, 2] - segments[owners, 0])
+    lons = segments[owners, 1] + t * (segments[owners, 3] - segments[owners, 1])
+    inside = (lats >= min_lat) & (lats < max_lat) & (lons >= min_lon) & (lons < max_lon)
+    lats, lons = lats[inside], lons[inside]
+    rows = np.floor((lats - min_lat) / cell_lat).astype(np.int64)
+    cols = np.floor((lons - min_lon) / cell_lon).astype(np.int64)
+    cells = rows * cells_per_side + cols
+    distances = ((lats - (min_lat + (rows + 0.5) * cell_lat)) / cell_lat) ** 2 + ((lons - (min_lon + (cols + 0.5) * cell_lon)) / cell_lon) ** 2
+    order = np.lexsort((distances, cells))
+    first = order[np.unique(cells[order], return_index=True)[1]]
+    return np.column_stack([lats[first], lons[first]])
+
+# Define function to flag the points with a traffic signal within radius meters, compared in blocks to bound memory use
+def signals_within(points, signals, radius=SIGNAL_RADIUS, block=512):
+    flags = np.zeros(len(points), dtype=bool)
+    if len(points) == 0 or len(signals) == 0:
+        return flags
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(points[:, 0].mean()))
+    for start in range(0, len(points), block):
+        chunk = points[start:start + block]
+        dy = (chunk[:, None, 0] - signals[None, :, 0]) * METERS_PER_DEGREE
+        dx = (chunk[:, None, 1] - signals[None, :, 1]) * scale_x
+        flags[start:start + block] = ((dx * dx + dy * dy) <= radius * radius).any(axis=1)
+    return flags
+
+
+# Define function to fetch the weather once per weather cache cell among the points, concurrently
+# Returns the weather features of each point as a DataFrame (NaN where the weather could not be retrieved), the number of distinct cells and the warnings raised (each once)
+def shared_weather(points, weather_cache):
+    keys = [weather_cache.key(lat, lon) for lat, lon in points]
+    representatives = {}
+    for key, (lat, lon) in zip(keys, points):
+        representatives.setdefault(key, (lat, lon))
+    futures = {key: executor.submit(weather_cache.get, lat, lon) for key, (lat, lon) in representatives.items()}
+    wait(futures.values())
+    results = {key: future.result() for key, future in futures.items() if future.exception() is None}
+    features = {key: weather_features(weather_data) for key, (weather_data, _) in results.items() if weather_data is not None}
+    warnings = list(dict.fromkeys(warning for _, cell_warnings in results.values() for warning in cell_warnings))
+    rows = [features.get(key, {}) for key in keys]
+    return pd.DataFrame(rows, columns=INPUT_COLUMNS[5:10]), len(representatives), warnings
+
+
+# Define function to score the road points of a map viewport for a severity heatmap
+# Road points, signals and weather come from bulk lookups deduplicated per cell, and every point is written into one feature buffer (laid out by a predictor.FeatureLayout) scored by one predict call
+# Roads and signals are kept in road_cache (a TTLCache, optional) so scoring the same view again only refreshes the weather
+# Returns a DataFrame of lat, lon and severity for the points that could be scored, a dict of statistics and any warnings raised
+def score_viewport(bounds, model, layout, weather_cache, road_cache=None, cells_per_side=CELLS_PER_SIDE):
+    start = time.perf_counter()
+    min_lat, min_lon, max_lat, max_lon = bounds
+    max_degrees = MAX_VIEWPORT_DEGREES if index_covers(bounds) else MAX_OVERPASS_VIEWPORT_DEGREES
+    if max_lat - min_lat > max_degrees or max_lon - min_lon > max_degrees:
+        raise ValueError(f"The map view is too large to score, zoom in to at most {max_degrees} degrees across.")
+    key = tuple(round(value, 4) for value in bounds)
+    found, roads_and_signals = road_cache.get(key) if road_cache is not None else (False, None)
+    if found:
+        segments, signals = roads_and_signals
+        warnings = []
+    else:
+        segments, signals, warnings = fetch_roads_and_signals(bounds)
+        if segments is not None and road_cache is not None:
+            road_cache.set(key, (segments, signals))
+    if segments is None:
+        return pd.DataFrame(columns=["lat", "lon", "severity"]), {"road_points": 0, "weather_cells": 0, "scored": 0, "seconds": time.perf_counter() - start}, warnings
+    points = sample_road_points(segments, bounds, cells_per_side)
+    traffic_signal = signals_within(points, signals)
+    weather, weather_cells, weather_warnings = shared_weather(points, weather_cache)
+    warnings = warnings + weather_warnings
+    # Local month, day and hour of every point from the timezone grid
+    timezone_names = get_resolver().timezones_at(points[:, 0], points[:, 1])
+    months, days, hours = local_time_features(pd.DatetimeIndex([pd.Timestamp.now(tz="UTC")] * len(points)), timezone_names)
+    features = layout.fill({"Start_Month": months, "Start_Day": days, "Start_Hour": hours, "Start_Lat": points[:, 0], "Start_Lng": points[:, 1], "Traffic_Signal": traffic_signal, **weather}, len(points))
+    scorable = ~np.isnan(features).any(axis=1) & pd.notna(timezone_names)
+    if len(points) > scorable.sum():
+        warnings.append(f"Weather or timezone could not be determined for {len(points) - scorable.sum()} of {len(points)} road points.")
+    results = pd.DataFrame({"lat": points[scorable, 0], "lon": points[scorable, 1]})
+    if scorable.any():
+        with metrics.timer("stage_seconds", stage="grid_inference"):
+            results["severity"] = np.asarray(layout.predict(model, features[scorable])).astype(np.int64) # one call for every point
+    else:
+        results["severity"] = pd.Series(dtype=np.int64)
+    stats = {"road_points": len(points), "weather_cells": weather_cells, "scored": int(scorable.sum()), "seconds": time.perf_counter() - start}
+    metrics.observe("grid_seconds", stats["seconds"])
+    return results, stats, warnings
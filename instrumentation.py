@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+# Define a histogram of observed values in fixed buckets, from which percentiles are estimated
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    # Estimate a percentile (0-100) by interpolating within the bucket it falls in
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        target = self.count * percent / 100
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                lower = self.buckets[position - 1] if position > 0 else 0.0
+                upper = min(self.buckets[position], self.max)
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+        return self.max
+
+
+# Define the in-process store of stage timings, counters and recent events
+class Metrics:
+    def __init__(self, max_events=10000):
+        self.histograms = {} # (name, labels) -> Histogram
+        self.counters = {} # (name, labels) -> count
+        self.events = deque(maxlen=max_events) # most recent observations, for JSONL export
+        self.collectors = {} # name -> function returning {label value: number}, read at export time
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+    # Record how long a stage took, in seconds
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+            self.events.append({"time": time.time(), "metric": name, "seconds": seconds, **labels})
+
+    def increment(self, name, amount=1, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Time the body of a with block as a stage, labels can be added inside the block through the yielded dict
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Register a function whose values (such as cache hit and miss counts) are exported as gauges
+    def register_collector(self, name, collect):
+        self.collectors[name] = collect
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.events.clear()
+
+    # Summary rows of every histogram: count, mean and percentiles in seconds
+    def summary(self):
+        with self._lock:
+            rows = []
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                rows.append({
+                    "metric": name,
+                    **dict(labels),
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count,
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99),
+                    "max": histogram.max,
+                })
+            return rows
+
+    def counter_rows(self):
+        with self._lock:
+            return [{"metric": name, **dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())]
+
+    # Export everything in the Prometheus text exposition format
+    def to_prometheus(self, prefix="accident_predictor_"):
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{prefix}{name}_bucket{label_text(labels, [('le', '+Inf' if bound == float('inf') else bound)])} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{label_text(labels)} {histogram.sum}")
+                    lines.append(f"{prefix}{name}_count{label_text(labels)} {histogram.count}")
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{prefix}{name}{label_text(labels)} {value}")
+        for name, collect in sorted(self.collectors.items()):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            for key, value in sorted(collect().items()):
+                lines.append(f"{prefix}{name}{label_text([('stat', key)])} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Export the recent observations as JSON lines
+    def to_jsonl(self):
+        with self._lock:
+            return "".join(json.dumps(event) + "\n" for event in self.events)
+
+
+# Define the metrics store shared by the whole process
+metrics = Metrics()
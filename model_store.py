@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+# Directory holding one subdirectory per model file id
+STORE_DIR = "model_store"
+
+# Base URL models are downloaded from (GDRIVE_URL points it elsewhere, such as the benchmark stand-in server)
+GDRIVE_URL = os.environ.get("GDRIVE_URL", "https://drive.google.com")
+
+
+# Define function to compute the SHA-256 checksum of a file without reading it into memory at once
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Define function to download a file from Google Drive
+def download_model(file_id, path):
+    import gdown # only needed when the store has no valid copy
+    gdown.download(f"{GDRIVE_URL}/uc?id={file_id}", path, quiet=False)
+
+# Define function to time a single prediction on a zero row, which forces any lazy setup inside the estimators
+def warm_up(model):
+    feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is None:
+        return None
+    start = time.perf_counter()
+    model.predict(pd.DataFrame(np.zeros((1, len(feature_names))), columns=feature_names))
+    return time.perf_counter() - start
+
+
+# Define function to load a model by its Google Drive file id, downloading it only when the local store has no valid copy
+# The downloaded pickle is converted once to joblib format, which lets the estimators' NumPy arrays (the forest's trees) be memory-mapped instead of copied on load
+# Returns the model and the seconds spent downloading, deserializing and making the first prediction
+def load_model(file_id, store_dir=STORE_DIR, expected_sha256=None):
+    import joblib
+    import sklearn # imported here so importing this module stays cheap, unpickling the model imports it anyway
+    timings = {"download": 0.0, "deserialize": 0.0, "first_predict": None}
+    version_dir = os.path.join(store_dir, file_id)
+    pickle_path = os.path.join(version_dir, "applet_model.pkl")
+    joblib_path = os.path.join(version_dir, "applet_model.joblib")
+    manifest_path = os.path.join(version_dir, "manifest.json")
+    os.makedirs(version_dir, exist_ok=True)
+
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+
+    # Warm start: reuse the stored joblib copy when it is intact, was converted from the expected pickle (when a checksum is expected) and was written by the installed scikit-learn version
+    if (manifest is not None and os.path.exists(joblib_path)
+            and manifest.get("sklearn_version") == sklearn.__version__
+            and (expected_sha256 is None or manifest.get("pickle_sha256") == expected_sha256)
+            and file_checksum(joblib_path) == manifest.get("joblib_sha256")):
+        start = time.perf_counter()
+        model = joblib.load(joblib_path, mmap_mode='r')
+        timings["deserialize"] = time.perf_counter() - start
+        timings["first_predict"] = warm_up(model)
+        return model, timings
+
+    # Otherwise download the pickle, unless a copy matching the expected (or else the recorded) checksum is already present
+    # Files are written under names unique to this process and moved into place, so processes filling the store at the same time never write to the same file
+    suffix = f".{os.getpid()}.tmp"
+    pickle_sha256 = expected_sha256
+    if pickle_sha256 is None and manifest is not None:
+        pickle_sha256 = manifest.get("pickle_sha256")
+    if not (os.path.exists(pickle_path) and pickle_sha256 is not None and file_checksum(pickle_path) == pickle_sha256):
+        start = time.perf_counter()
+        download_path = pickle_path + suffix
+        download_model(file_id, download_path)
+        if expected_sha256 is not None and file_checksum(download_path) != expected_sha256:
+            os.remove(download_path)
+            raise ValueError(f"Checksum of downloaded model {file_id} does not match the expected checksum.")
+        os.replace(download_path, pickle_path)
+        timings["download"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(pickle_path, 'rb') as file:
+        model = pickle.load(file)
+    timings["deserialize"] = time.perf_counter() - start
+
+    # Save the joblib copy used by later starts, then record checksums of both files
+    joblib.dump(model, joblib_path + suffix)
+    os.replace(joblib_path + suffix, joblib_path)
+    manifest = {
+        "file_id": file_id,
+        "pickle_sha256": file_checksum(pickle_path),
+        "joblib_sha256": file_checksum(joblib_path),
+        "sklearn_version": sklearn.__version__,
+        "stored_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(manifest_path + suffix, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_path + suffix, manifest_path)
+    timings["first_predict"] = warm_up(model)
+    return model, timings
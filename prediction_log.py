@@ -0,0 +1,146 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+import pandas as pd
+from instrumentation import metrics
+
+# Columns of the log: (column name in the database, SQLite type, column name displayed in the app)
+LOG_COLUMNS = [
+    ("prediction", "INTEGER", "Traffic Impact Prediction"),
+    ("local_time", "TEXT", "Local Time"),
+    ("latitude", "TEXT", "Latitude"),
+    ("longitude", "TEXT", "Longitude"),
+    ("temperature", "REAL", "Temperature (°F)"),
+    ("pressure", "REAL", "Pressure (inHg)"),
+    ("visibility", "REAL", "Visibility (mi)"),
+    ("humidity", "REAL", "Humidity (%)"),
+    ("wind_speed", "REAL", "Wind Speed (mph)"),
+    ("traffic_signal", "INTEGER", "Traffic Signal"),
+]
+DISPLAY_COLUMNS = [display for _, _, display in LOG_COLUMNS]
+
+# Longest wait in seconds before retrying a batch the database refused (the wait doubles from 0.1 s after each failure)
+MAX_RETRY_SECONDS = 30
+
+
+# Define the prediction log, stored in SQLite and written by a background thread
+# Sessions only place rows on a bounded queue, so logging a prediction never waits on the disk and never rewrites earlier rows
+class PredictionLog:
+    def __init__(self, path="prediction_log.db", seed_csv="prediction_log.csv", max_pending=1000):
+        self.path = path
+        self.dropped = 0 # rows discarded because the queue stayed full
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = [] # rows queued but not yet committed, so reads can include them straight away
+        self._lock = threading.Lock() # guards the queue and the pending rows
+        self._commit_lock = threading.Lock() # held while a batch moves from pending to the database, so readers see each row exactly once
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL") # readers don't block the writer
+            connection.execute(f"CREATE TABLE IF NOT EXISTS predictions (id INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(f'{name} {kind}' for name, kind, _ in LOG_COLUMNS)})")
+            # Initialize a new log with the example predictions from the original CSV log
+            if connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] == 0 and seed_csv and os.path.exists(seed_csv):
+                seed = pd.read_csv(seed_csv)[DISPLAY_COLUMNS]
+                connection.executemany(self._insert_sql(), [self._to_record(row) for row in seed.itertuples(index=False)])
+        self._writer = threading.Thread(target=self._write_loop, name="prediction-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _insert_sql():
+        return f"INSERT INTO predictions ({', '.join(name for name, _, _ in LOG_COLUMNS)}) VALUES ({', '.join('?' for _ in LOG_COLUMNS)})"
+
+    # Convert a row of display values into the types stored in the database
+    @staticmethod
+    def _to_record(row):
+        record = list(row)
+        record[0] = int(record[0])
+        record[1] = str(record[1])
+        record[4:9] = [float(value) for value in record[4:9]]
+        record[9] = int(bool(record[9]) if not isinstance(record[9], str) else record[9] == "True")
+        return tuple(record)
+
+    # Queue a row (in DISPLAY_COLUMNS order) to be written, dropping it if the writer has fallen max_pending rows behind
+    def append(self, row):
+        record = self._to_record(row)
+        with self._lock:
+            try:
+                self._queue.put_nowait(record)
+                self._pending.append(record)
+            except queue.Full:
+                self.dropped += 1
+
+    # Define the background loop that commits queued rows in batches
+    # A batch the database refuses (locked, disk full, ...) is kept and retried with a growing wait on a new connection, so rows are never lost and the writer never stops
+    def _write_loop(self):
+        connection = None
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            while not self._queue.empty() and len(batch) < 500: # write everything already waiting in the same transaction
+                next_record = self._queue.get()
+                if next_record is None:
+                    self._queue.put(None)
+                    break
+                batch.append(next_record)
+            failures = 0
+            while True:
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    self._commit(connection, batch)
+                    break
+                except sqlite3.Error as e:
+                    failures += 1
+                    metrics.increment("prediction_log_write_failures_total", error=e.__class__.__name__)
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+                    time.sleep(min(0.1 * 2 ** (failures - 1), MAX_RETRY_SECONDS))
+        if connection is not None:
+            connection.close()
+
+    # Write a batch in one transaction and remove it from the pending rows, which stay pending if the transaction fails
+    def _commit(self, connection, batch):
+        with self._commit_lock:
+            with connection:
+                connection.executemany(self._insert_sql(), batch)
+            with self._lock:
+                for written in batch:
+                    self._pending.remove(written)
+
+    # Stop the writer once every queued row has been written
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    # Reads take the pending rows and query the database under the commit lock, so a batch committed in between is neither counted twice nor missed
+    # Appends only take the queue lock, so they never wait on a commit
+    def count(self):
+        with self._commit_lock:
+            with self._lock:
+                pending = len(self._pending)
+            with self._connect() as connection:
+                return connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] + pending
+
+    # Return one page of the log, newest predictions first
+    def recent(self, limit=50, offset=0):
+        with self._commit_lock:
+            with self._lock:
+                pending = list(reversed(self._pending))
+            records = pending[offset:offset + limit]
+            with self._connect() as connection:
+                records += connection.execute(
+                    f"SELECT {', '.join(name for name, _, _ in LOG_COLUMNS)} FROM predictions ORDER BY id DESC LIMIT ? OFFSET ?",
+                    (limit - len(records), max(offset - len(pending), 0)),
+                ).fetchall()
+        log = pd.DataFrame(records, columns=DISPLAY_COLUMNS)
+        log["Traffic Signal"] = log["Traffic Signal"].astype(bool)
+        return log
@@ -0,0 +1,180 @@
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from enrichment import enrich_location
+from weather import weather_features
+from timezones import get_resolver
+from instrumentation import metrics
+
+# Columns of the model input in the order they are assembled (reordered to the model feature order before predicting)
+INPUT_COLUMNS = ["Start_Month", "Start_Day", "Start_Hour", "Start_Lat", "Start_Lng", "Temperature(F)", "Pressure(in)", "Visibility(mi)", "Humidity(%)", "Wind_Speed(mph)", "Traffic_Signal"]
+
+# Display name, color and heading font size (px) of each severity level
+SEVERITY_DISPLAY = {
+    1: ("Minor", "green", 52),
+    2: ("Moderate", "yellow", 54),
+    3: ("Major", "orange", 56),
+    4: ("SEVERE", "red", 58),
+}
+SEVERITY_LABELS = {severity: label for severity, (label, _, _) in SEVERITY_DISPLAY.items()}
+SEVERITY_COLORS = {severity: color for severity, (_, color, _) in SEVERITY_DISPLAY.items()}
+
+# Define function to load the model feature order, dropping the target column
+def load_feature_order(path="model_features.csv"):
+    model_features = pd.read_csv(path)
+    return model_features[model_features["Feature"] != "Severity"]["Feature"].tolist()
+
+# Define function to load a pickled model file
+def load_model_file(path="applet_model.pkl"):
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+# Define function to generate the current local time at a location, None if the timezone could not be determined
+def local_time_at(lat, lon):
+    local_timezone = get_resolver().timezone(lat, lon)
+    if local_timezone is None:
+        return None
+    return pd.to_datetime(datetime.now(local_timezone), format='ISO8601')
+
+# Define function to assemble the model input row for a location from its local time and enrichment, in INPUT_COLUMNS order
+def feature_row(local_time, lat, lon, enrichment):
+    weather = weather_features(enrichment.weather_data)
+    return [local_time.month, local_time.dayofweek, local_time.hour, lat, lon, weather["Temperature(F)"], weather["Pressure(in)"], weather["Visibility(mi)"], weather["Humidity(%)"], weather["Wind_Speed(mph)"], enrichment.traffic_signal]
+
+# Define the model's feature layout, resolving the model feature order into fixed positions once
+# Features are written straight into a float32 buffer in the model's column order, so scoring skips building and reordering a DataFrame
+# The model may use any subset of INPUT_COLUMNS, the values of the columns it does not use are skipped
+class FeatureLayout:
+    def __init__(self, feature_order):
+        self.feature_order = list(feature_order)
+        unknown = [name for name in self.feature_order if name not in INPUT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Model features not produced by the pipeline: {', '.join(unknown)}")
+        if len(set(self.feature_order)) != len(self.feature_order):
+            raise ValueError("Model features are listed more than once.")
+        self.position = {name: position for position, name in enumerate(self.feature_order)} # feature name -> column of the buffer
+        self.sources = np.array([index for index, name in enumerate(INPUT_COLUMNS) if name in self.position], dtype=np.int64) # INPUT_COLUMNS values the model uses
+        self.targets = np.array([self.position[INPUT_COLUMNS[index]] for index in self.sources], dtype=np.int64) # column each of those values is written to
+        self._local = threading.local() # one preallocated buffer per thread, so sessions scoring at the same time never share one
+
+    # Return a buffer for a number of rows, reusing this thread's buffer (grown when too small)
+    # Its contents are only valid until the next buffer, matrix or fill call on the same thread
+    def buffer(self, rows=1):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < rows:
+            buffer = self._local.buffer = np.empty((rows, len(self.feature_order)), dtype=np.float32)
+        return buffer[:rows]
+
+    # Write rows of INPUT_COLUMNS values (as built by feature_row) into a buffer in the model's column order
+    def matrix(self, rows):
+        buffer = self.buffer(len(rows))
+        buffer[:, self.targets] = np.asarray(rows, dtype=np.float32)[:, self.sources]
+        return buffer
+
+    # Write columns of values (feature name -> one value per row) into a buffer in the model's column order
+    def fill(self, columns, rows):
+        missing = [name for name in self.feature_order if name not in columns]
+        if missing:
+            raise ValueError(f"Model features missing from the input: {', '.join(missing)}")
+        buffer = self.buffer(rows)
+        for name, values in columns.items():
+            if name in self.position:
+                buffer[:, self.position[name]] = values
+        return buffer
+
+    # Score a buffer; a model left uncompiled was fitted on named columns, so it is given a DataFrame over the buffer instead
+    def predict(self, model, buffer):
+        if hasattr(model, "feature_names_in_"):
+            return model.predict(pd.DataFrame(buffer, columns=self.feature_order, copy=False))
+        return model.predict(buffer)
+
+
+# Define function to explain why a prediction cannot be generated for an enrichment, None if it can
+# An address is only required when the location was geocoded
+def prediction_blocker(enrichment):
+    address_found = enrichment.geocode is not None or not enrichment.geocoded
+    if enrichment.weather_data is not None and address_found and enrichment.is_road:
+        return None
+    elif not enrichment.is_road:
+        return "Selected location is not a road."
+    elif enrichment.weather_data is None and address_found:
+        return "Failed to retrieve weather data."
+    elif enrichment.weather_data is not None and not address_found:
+        return "Address not valid."
+    else:
+        return "Prediction cannot be generated."
+
+
+# Define a location that has been enriched and is ready to score (row is None when it cannot be scored)
+@dataclass
+class PreparedLocation:
+    lat: float
+    lon: float
+    local_time: object
+    enrichment: object
+    row: list = None
+    error: str = None
+
+    # Result returned to callers, with the severity once it has been predicted
+    def result(self, severity=None):
+        return {
+            "lat": self.lat,
+            "lon": self.lon,
+            "severity": None if severity is None else int(severity),
+            "label": SEVERITY_LABELS.get(severity) if severity is not None else None,
+            "error": self.error,
+            "local_time": None if self.local_time is None else self.local_time.isoformat(),
+            "address": self.enrichment.address if self.enrichment is not None else None,
+            "traffic_signal": self.enrichment.traffic_signal if self.enrichment is not None else None,
+            "is_road": self.enrichment.is_road if self.enrichment is not None else None,
+        }
+
+
+# Define function to assemble the prepared location for a location's local time and enrichment, with the reason it cannot be scored when it cannot
+def prepare_location(lat, lon, local_time, enrichment):
+    if local_time is None:
+        return PreparedLocation(lat, lon, None, enrichment, error="Timezone could not be determined for the given coordinates.")
+    error = prediction_blocker(enrichment)
+    if error is not None:
+        return PreparedLocation(lat, lon, local_time, enrichment, error=error)
+    return PreparedLocation(lat, lon, local_time, enrichment, row=feature_row(local_time, lat, lon, enrichment))
+
+
+# Define the enrichment and prediction pipeline used by the app, usable without Streamlit
+class Predictor:
+    def __init__(self, model, feature_order, enrichment_cache, weather_cache, max_workers=32, geocode=True):
+        self.model = model
+        self.layout = FeatureLayout(feature_order)
+        self.enrichment_cache = enrichment_cache
+        self.weather_cache = weather_cache
+        self.geocode = geocode # the address is not a model feature, so callers that do not show it can skip the reverse geocode
+        # Locations are enriched on their own pool, the lookups for each location run on the enrichment pool
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="predictor")
+
+    # Enrich a location and assemble its model input row
+    # The app runs the same steps one at a time (local_time_at, enrich_location, prepare_location) so it can reuse each across reruns
+    def prepare(self, lat, lon):
+        with metrics.timer("stage_seconds", stage="timezone"):
+            local_time = local_time_at(lat, lon)
+        if local_time is None:
+            return prepare_location(lat, lon, None, None)
+        with metrics.timer("stage_seconds", stage="enrichment"):
+            enrichment = enrich_location(lat, lon, self.enrichment_cache, self.weather_cache, self.geocode)
+        return prepare_location(lat, lon, local_time, enrichment)
+
+    # Score prepared locations with a single model call, returning one severity per location
+    def score(self, prepared):
+        with metrics.timer("stage_seconds", stage="inference"):
+            return list(self.layout.predict(self.model, self.layout.matrix([location.row for location in prepared])))
+
+    # Enrich any number of (lat, lon) points concurrently and score all of the ones that can be scored at once
+    def predict_many(self, points):
+        prepared = list(self.executor.map(lambda point: self.prepare(*point), points))
+        scorable = [location for location in prepared if location.row is not None]
+        severities = dict(zip(map(id, scorable), self.score(scorable))) if scorable else {}
+        return [location.result(severities.get(id(location))) for location in prepared]
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from caching import TTLCache
+from fast_inference import compile_model
+from model_store import load_model
+from predictor import Predictor, load_feature_order, load_model_file
+from weather import WeatherCache, weather_provider
+from instrumentation import metrics
+
+
+# Define the micro-batcher that collects locations arriving from concurrent requests and scores them with one model call
+# Batches are scored on the batcher's own thread, so inference never queues behind enrichment lookups stalled on a slow backend
+class MicroBatcher:
+    def __init__(self, predictor, max_batch=256, max_wait=0.005):
+        self.predictor = predictor
+        self.max_batch = max_batch # most locations scored by one model call
+        self.max_wait = max_wait # seconds to wait for more locations after the first arrives
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+
+    # Queue a prepared location and wait for its severity
+    async def submit(self, prepared):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((prepared, future))
+        return await future
+
+    # Define the loop that drains the queue into batches
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                severities = await loop.run_in_executor(self.executor, self.predictor.score, [prepared for prepared, _ in batch])
+                for (_, future), severity in zip(batch, severities):
+                    if not future.done():
+                        future.set_result(severity)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+# Define function to read the points from a request body: {"lat": .., "lon": ..} for one location or {"points": [{"lat": .., "lon": ..}, ...]} for several
+def parse_points(body):
+    points = body["points"] if isinstance(body, dict) and "points" in body else [body]
+    parsed = []
+    for point in points:
+        lat, lon = float(point["lat"]), float(point["lon"])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"Coordinates out of range: {lat}, {lon}")
+        parsed.append((lat, lon))
+    return parsed
+
+async def predict(request):
+    try:
+        body = await request.json()
+        points = parse_points(body)
+    except (ValueError, KeyError, TypeError) as e:
+        return web.json_response({"error": f"Invalid request: {e}"}, status=400)
+    loop = asyncio.get_running_loop()
+    predictor = request.app["predictor"]
+    # Enrich every location concurrently, then queue the scorable ones for the next micro-batch
+    prepared = await asyncio.gather(*(loop.run_in_executor(None, predictor.prepare, lat, lon) for lat, lon in points))
+    scorable = [location for location in prepared if location.row is not None]
+    severities = await asyncio.gather(*(request.app["batcher"].submit(location) for location in scorable))
+    by_location = dict(zip(map(id, scorable), severities))
+    results = [location.result(by_location.get(id(location))) for location in prepared]
+    if isinstance(body, dict) and "points" in body:
+        return web.json_response({"predictions": results})
+    return web.json_response(results[0])
+
+# Per-stage timings, retries and cache counts of this worker in the Prometheus text format
+async def prometheus_metrics(request):
+    return web.Response(text=metrics.to_prometheus(), content_type="text/plain")
+
+async def health(request):
+    return web.json_response({"status": "ok", "pid": os.getpid()})
+
+
+# Define function to build the service, loading the model once per worker process
+def create_app(args):
+    async def start(app):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix="service"))
+        if args.model:
+            model = load_model_file(args.model)
+        else:
+            model, _ = load_model(args.model_id)
+        predictor = Predictor(
+            compile_model(model),
+            load_feature_order(args.features),
+            TTLCache(max_entries=4096, ttl=15*60),
+            WeatherCache(weather_provider(args.owm_key)),
+            geocode=args.geocode,
+        )
+        metrics.register_collector("location_cache", predictor.enrichment_cache.stats)
+        metrics.register_collector("weather_cache", predictor.weather_cache.stats)
+        app["predictor"] = predictor
+        app["batcher"] = MicroBatcher(predictor, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+        app["batcher_task"] = asyncio.create_task(app["batcher"].run())
+
+    async def stop(app):
+        app["batcher_task"].cancel()
+        app["batcher"].executor.shutdown(wait=False)
+
+    app = web.Application()
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
+    app.router.add_post("/predict", predict)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", prometheus_metrics)
+    return app
+
+# Define function to run one worker process; workers share the port so the kernel spreads connections across them
+def serve(args):
+    web.run_app(create_app(args), host=args.host, port=args.port, reuse_port=args.workers > 1, print=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP service returning traffic impact predictions for accident locations.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes, each with its own copy of the model")
+    parser.add_argument("--threads", type=int, default=64, help="threads per worker for enrichment lookups")
+    parser.add_argument("--max-batch", type=int, default=256, help="most locations scored by one model call")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="milliseconds to wait for more locations before scoring a batch")
+    parser.add_argument("--model", help="pickled model file (otherwise the model is loaded from the local model store)")
+    parser.add_argument("--model-id", default=os.environ.get("MODEL_FILE_ID"), help="Google Drive file id of the model")
+    parser.add_argument("--features", default="model_features.csv", help="model feature order file")
+    parser.add_argument("--owm-key", default=os.environ.get("OWM_API_KEY"), help="OpenWeatherMap API key")
+    parser.add_argument("--geocode", action="store_true", help="reverse geocode each location to return its address (rate limited by Nominatim to 1 request per second)")
+    args = parser.parse_args()
+    if not args.model and not args.model_id:
+        parser.error("either --model or --model-id (or MODEL_FILE_ID) is required")
+    if args.workers == 1:
+        serve(args)
+    else:
+        # Fill the model store once before starting the workers, so they all load the stored copy instead of downloading and converting it together
+        # It is filled in a separate process so this one forks the workers without the model libraries loaded
+        if not args.model:
+            store = multiprocessing.Process(target=load_model, args=(args.model_id,), name="model-store")
+            store.start()
+            store.join()
+            if store.exitcode != 0:
+                sys.exit(f"Could not load model {args.model_id} into the model store.")
+        workers = [multiprocessing.Process(target=serve, args=(args,), name=f"worker-{i}") for i in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
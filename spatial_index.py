@@ -0,0 +1,228 @@
+import json
+import math
+import os
+import sys
+import xml.etree.ElementTree as ET
+import numpy as np
+
+# Size of a grid cell in degrees (0.01 degrees is about 1.1 km north-south)
+CELL_SIZE = 0.01
+
+# Meters per degree of latitude, used for the local flat-earth distance approximation
+METERS_PER_DEGREE = 111320.0
+
+# Radii matching the Overpass checks in enrichment.py
+SIGNAL_RADIUS = 400 # meters (about 1/4 mile)
+ROAD_RADIUS = 15 # meters (about 50 feet)
+
+# Files written to the index directory
+ARRAY_FILES = ["signal_keys", "signal_coords", "signal_ids", "segment_keys", "segment_cells", "segment_coords", "segment_way_ids"]
+
+
+# Define function to convert lat/lon into grid row and column indices
+def cell_indices(lat, lon, cell_size=CELL_SIZE):
+    return np.floor((np.asarray(lat) + 90) / cell_size).astype(np.int64), np.floor((np.asarray(lon) + 180) / cell_size).astype(np.int64)
+
+# Define function to combine grid row and column indices into a single sortable cell key
+def cell_key(row, col, cell_size=CELL_SIZE):
+    return row * (int(math.ceil(360 / cell_size)) + 1) + col
+
+
+# Define the grid index over traffic signal nodes and road segments
+# Signals are stored sorted by the key of the cell they fall in, road segments are registered in every cell their bounding box touches
+# Arrays are memory-mapped when loaded so opening a large index costs almost nothing until cells are actually read
+class SpatialIndex:
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        self.cell_size = meta["cell_size"]
+        self.bounds = meta["bounds"] # [min_lat, min_lon, max_lat, max_lon] covered by the OSM extract
+        for name in ARRAY_FILES:
+            setattr(self, name, arrays[name])
+
+    # True if the location lies inside the area the OSM extract covered
+    def covers(self, lat, lon):
+        min_lat, min_lon, max_lat, max_lon = self.bounds
+        return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+    # Define function to find the positions in a sorted key array belonging to a block of cells
+    def _cells(self, keys, min_row, max_row, min_col, max_col):
+        positions = []
+        # Cells in a grid row have consecutive keys, so each row of the block is one contiguous slice of the sorted keys
+        for r in range(min_row, max_row + 1):
+            start = np.searchsorted(keys, cell_key(r, min_col, self.cell_size), side="left")
+            end = np.searchsorted(keys, cell_key(r, max_col, self.cell_size), side="right")
+            if end > start:
+                positions.append(np.arange(start, end))
+        return np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+
+    # Define function to find the positions in a sorted key array belonging to cells within radius meters of the location
+    def _candidates(self, keys, lat, lon, radius):
+        row, col = cell_indices(lat, lon, self.cell_size)
+        # Number of neighbouring cells to search in each direction so the whole radius is covered
+        row_span = int(math.ceil(radius / (self.cell_size * METERS_PER_DEGREE)))
+        col_span = int(math.ceil(radius / (self.cell_size * METERS_PER_DEGREE * max(math.cos(math.radians(abs(lat) + self.cell_size)), 1e-6))))
+        return self._cells(keys, row - row_span, row + row_span, col - col_span, col + col_span)
+
+    # Define function to find the positions in a sorted key array belonging to cells that overlap a [min_lat, min_lon, max_lat, max_lon] box
+    def _candidates_in(self, keys, bounds):
+        min_row, min_col = cell_indices(bounds[0], bounds[1], self.cell_size)
+        max_row, max_col = cell_indices(bounds[2], bounds[3], self.cell_size)
+        return self._cells(keys, int(min_row), int(max_row), int(min_col), int(max_col))
+
+    # Define function to return the (lat, lon) of every traffic signal inside a box
+    def signals_in(self, bounds):
+        coords = np.asarray(self.signal_coords[self._candidates_in(self.signal_keys, bounds)])
+        inside = (coords[:, 0] >= bounds[0]) & (coords[:, 1] >= bounds[1]) & (coords[:, 0] <= bounds[2]) & (coords[:, 1] <= bounds[3])
+        return coords[inside]
+
+    # Define function to return the (lat1, lon1, lat2, lon2) of every road segment registered in a cell overlapping a box
+    def segments_in(self, bounds):
+        segments = np.unique(np.asarray(self.segment_cells[self._candidates_in(self.segment_keys, bounds)]))
+        return np.asarray(self.segment_coords[segments])
+
+    # Define function to return the ids of traffic signal nodes within radius meters of the location
+    def signals_near(self, lat, lon, radius=SIGNAL_RADIUS):
+        positions = self._candidates(self.signal_keys, lat, lon, radius)
+        if len(positions) == 0:
+            return []
+        coords = np.asarray(self.signal_coords[positions])
+        dy = (coords[:, 0] - lat) * METERS_PER_DEGREE
+        dx = (coords[:, 1] - lon) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        return [int(node_id) for node_id in self.signal_ids[positions[np.hypot(dx, dy) <= radius]]]
+
+    # Define function to return the ids of highway ways with a segment within radius meters of the location
+    def roads_near(self, lat, lon, radius=ROAD_RADIUS):
+        positions = self._candidates(self.segment_keys, lat, lon, radius)
+        if len(positions) == 0:
+            return []
+        segments = np.unique(np.asarray(self.segment_cells[positions]))
+        coords = np.asarray(self.segment_coords[segments])
+        # Project segment end points into meters relative to the location, then measure the distance from the origin to each segment
+        scale_x = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        ax = (coords[:, 1] - lon) * scale_x
+        ay = (coords[:, 0] - lat) * METERS_PER_DEGREE
+        dx = (coords[:, 3] - lon) * scale_x - ax
+        dy = (coords[:, 2] - lat) * METERS_PER_DEGREE - ay
+        length_squared = dx * dx + dy * dy
+        t = np.clip(-(ax * dx + ay * dy) / np.where(length_squared > 0, length_squared, 1), 0, 1)
+        distances = np.hypot(ax + t * dx, ay + t * dy)
+        return [int(way_id) for way_id in np.unique(self.segment_way_ids[segments[distances <= radius]])]
+
+    # Results in the {'elements': [...]} shape returned by the Overpass API
+    def traffic_presence(self, lat, lon):
+        return {'elements': [{'type': 'node', 'id': node_id} for node_id in self.signals_near(lat, lon)]}
+
+    def roads_presence(self, lat, lon):
+        return {'elements': [{'type': 'way', 'id': way_id} for way_id in self.roads_near(lat, lon)]}
+
+
+# Define function to load an index directory written by build_index, returning None if there is no index at that path
+def load_index(path):
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as file:
+        meta = json.load(file)
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAY_FILES}
+    return SpatialIndex(arrays, meta)
+
+
+# Define function to stream the top level elements (bounds, nodes, ways, relations) of an OSM XML extract
+# Each element is dropped from the root once the caller is done with it, so memory stays flat however large the extract is
+def iter_osm_elements(osm_path):
+    context = ET.iterparse(osm_path, events=("start", "end"))
+    _, root = next(context)
+    depth = 0 # levels below the root
+    for event, element in context:
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 0:
+            yield element
+            root.clear()
+
+# Define function to build an index directory from an OSM XML extract (.osm)
+# The extract is read twice so only the coordinates of nodes used by highway ways are held in memory
+def build_index(osm_path, out_path, cell_size=CELL_SIZE):
+    # First pass: collect traffic signals, highway ways and the extract bounds
+    signals = [] # (node id, lat, lon)
+    ways = [] # (way id, [node ids])
+    bounds = None
+    for element in iter_osm_elements(osm_path):
+        if element.tag == "bounds":
+            bounds = [float(element.get("minlat")), float(element.get("minlon")), float(element.get("maxlat")), float(element.get("maxlon"))]
+        elif element.tag == "node":
+            if any(tag.get("k") == "highway" and tag.get("v") == "traffic_signals" for tag in element.findall("tag")):
+                signals.append((int(element.get("id")), float(element.get("lat")), float(element.get("lon"))))
+        elif element.tag == "way":
+            if any(tag.get("k") == "highway" for tag in element.findall("tag")):
+                ways.append((int(element.get("id")), [int(nd.get("ref")) for nd in element.findall("nd")]))
+    # Second pass: look up the coordinates of the nodes the highway ways refer to
+    needed = {node_id for _, node_ids in ways for node_id in node_ids}
+    node_coords = {}
+    for element in iter_osm_elements(osm_path):
+        if element.tag == "node":
+            node_id = int(element.get("id"))
+            if node_id in needed:
+                node_coords[node_id] = (float(element.get("lat")), float(element.get("lon")))
+
+    # Signals sorted by cell key
+    signal_array = np.array([(lat, lon) for _, lat, lon in signals], dtype=np.float64).reshape(-1, 2)
+    signal_ids = np.array([node_id for node_id, _, _ in signals], dtype=np.int64)
+    signal_keys = cell_key(*cell_indices(signal_array[:, 0], signal_array[:, 1], cell_size), cell_size)
+    order = np.argsort(signal_keys, kind="stable")
+
+    # Road segments between consecutive nodes of each way, skipping nodes missing from the extract
+    segment_coords = []
+    segment_way_ids = []
+    for way_id, node_ids in ways:
+        points = [node_coords[node_id] for node_id in node_ids if node_id in node_coords]
+        for start, end in zip(points[:-1], points[1:]):
+            segment_coords.append((start[0], start[1], end[0], end[1]))
+            segment_way_ids.append(way_id)
+    segment_coords = np.array(segment_coords, dtype=np.float64).reshape(-1, 4)
+    segment_way_ids = np.array(segment_way_ids, dtype=np.int64)
+    # Register every segment in each cell its bounding box touches
+    row_min, col_min = cell_indices(np.minimum(segment_coords[:, 0], segment_coords[:, 2]), np.minimum(segment_coords[:, 1], segment_coords[:, 3]), cell_size)
+    row_max, col_max = cell_indices(np.maximum(segment_coords[:, 0], segment_coords[:, 2]), np.maximum(segment_coords[:, 1], segment_coords[:, 3]), cell_size)
+    single = (row_min == row_max) & (col_min == col_max) # most segments fall in a single cell
+    keys = [cell_key(row_min[single], col_min[single], cell_size)]
+    cells = [np.flatnonzero(single)]
+    for segment in np.flatnonzero(~single):
+        rows, cols = np.meshgrid(np.arange(row_min[segment], row_max[segment] + 1), np.arange(col_min[segment], col_max[segment] + 1))
+        keys.append(cell_key(rows.ravel(), cols.ravel(), cell_size))
+        cells.append(np.full(rows.size, segment))
+    segment_keys = np.concatenate(keys).astype(np.int64)
+    segment_cells = np.concatenate(cells).astype(np.int64)
+    segment_order = np.argsort(segment_keys, kind="stable")
+
+    if bounds is None: # fall back to the extent of the data when the extract has no <bounds> element
+        all_lats = np.concatenate([signal_array[:, 0], segment_coords[:, 0], segment_coords[:, 2]])
+        all_lons = np.concatenate([signal_array[:, 1], segment_coords[:, 1], segment_coords[:, 3]])
+        bounds = [float(all_lats.min()), float(all_lons.min()), float(all_lats.max()), float(all_lons.max())]
+
+    arrays = {
+        "signal_keys": signal_keys[order],
+        "signal_coords": signal_array[order],
+        "signal_ids": signal_ids[order],
+        "segment_keys": segment_keys[segment_order],
+        "segment_cells": segment_cells[segment_order],
+        "segment_coords": segment_coords,
+        "segment_way_ids": segment_way_ids,
+    }
+    meta = {"cell_size": cell_size, "bounds": bounds, "signals": len(signal_ids), "segments": len(segment_way_ids), "source": os.path.basename(osm_path)}
+    os.makedirs(out_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_path, f"{name}.npy"), array)
+    with open(os.path.join(out_path, "meta.json"), "w") as file:
+        json.dump(meta, file, indent=2)
+    return SpatialIndex(arrays, meta)
+
+
+# Build an index from the command line: python spatial_index.py <extract.osm> [index directory]
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python spatial_index.py <extract.osm> [index directory]")
+    index = build_index(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "osm_index")
+    print(f"Indexed {index.meta['signals']} traffic signals and {index.meta['segments']} road segments covering {index.bounds}")
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from xgboost import XGBClassifier
+from fast_inference import WALK_MAX_ROWS, FastVotingClassifier, FlatForest, compile_model
+from predictor import FeatureLayout, load_feature_order
+
+# Model feature order used by the app
+MODEL_FEATURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model_features.csv")
+
+
+# Fit a small model with the app's structure (a VotingClassifier of a random forest and XGBoost over the model features, severities 1 to 4)
+def fit_model(voting, weights, seed=0):
+    feature_order = load_feature_order(MODEL_FEATURES)
+    rng = np.random.default_rng(seed)
+    rows = pd.DataFrame(rng.random((1500, len(feature_order))), columns=feature_order)
+    severity = 1 + np.digitize(rows.sum(axis=1) + rng.normal(0, 0.5, len(rows)), np.quantile(rows.sum(axis=1), [0.25, 0.5, 0.75]))
+    model = VotingClassifier([
+        ("rf", RandomForestClassifier(n_estimators=25, max_depth=8, random_state=seed)),
+        ("xgb", XGBClassifier(n_estimators=25, max_depth=4, random_state=seed)),
+    ], voting=voting, weights=weights)
+    return model.fit(rows, severity)
+
+# Rows to score: random rows inside and around the training range, plus rows sitting exactly on the forest's split thresholds
+def scoring_rows(model, count=400, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.uniform(-0.2, 1.2, (count, len(model.feature_names_in_)))
+    forest = FlatForest(model.estimators_[0])
+    splits = np.flatnonzero(forest.left != np.arange(len(forest.left)))[:100]
+    on_threshold = rows[:len(splits)].copy()
+    on_threshold[np.arange(len(splits)), forest.feature[splits]] = forest.threshold[splits]
+    return pd.DataFrame(np.vstack([rows, on_threshold]), columns=model.feature_names_in_)
+
+
+@pytest.fixture(scope="module", params=[("soft", None), ("soft", [2, 1]), ("hard", None), ("hard", [1, 3])], ids=lambda param: f"{param[0]}-weights{param[1]}")
+def models(request):
+    voting, weights = request.param
+    model = fit_model(voting, weights)
+    return model, compile_model(model)
+
+
+def test_compiles(models):
+    _, engine = models
+    assert isinstance(engine, FastVotingClassifier)
+
+def test_predict_batch(models):
+    model, engine = models
+    rows = scoring_rows(model)
+    np.testing.assert_array_equal(engine.predict(rows), model.predict(rows))
+
+def test_predict_single_rows(models):
+    model, engine = models
+    rows = scoring_rows(model)
+    for position in range(0, len(rows), 10):
+        row = rows.iloc[[position]]
+        np.testing.assert_array_equal(engine.predict(row), model.predict(row))
+
+# Batches at and just past the size walked through the flattened forest take the two different forest paths
+@pytest.mark.parametrize("size", [1, WALK_MAX_ROWS, WALK_MAX_ROWS + 1, 64])
+def test_predict_batch_sizes(models, size):
+    model, engine = models
+    rows = scoring_rows(model).iloc[:size]
+    np.testing.assert_array_equal(engine.predict(rows), model.predict(rows))
+
+def test_predict_proba(models):
+    model, engine = models
+    if model.voting != "soft":
+        pytest.skip("a hard voting VotingClassifier has no predict_proba")
+    rows = scoring_rows(model)
+    np.testing.assert_allclose(engine.predict_proba(rows), model.predict_proba(rows), rtol=1e-5, atol=1e-6)
+    for position in range(0, len(rows), 25):
+        row = rows.iloc[[position]]
+        np.testing.assert_allclose(engine.predict_proba(row), model.predict_proba(row), rtol=1e-5, atol=1e-6)
+
+# The app scores float32 buffers assembled by FeatureLayout, and DataFrames may arrive with their columns in any order
+def test_input_forms(models):
+    model, engine = models
+    rows = scoring_rows(model)
+    expected = model.predict(rows)
+    layout = FeatureLayout(model.feature_names_in_)
+    np.testing.assert_array_equal(layout.predict(engine, rows.to_numpy(dtype=np.float32)), expected)
+    np.testing.assert_array_equal(engine.predict(rows[rows.columns[::-1]]), expected)
+
+def test_other_models_are_left_uncompiled():
+    model = fit_model("soft", None).estimators_[0]
+    assert compile_model(model) is model
@@ -0,0 +1,115 @@
+import math
+import threading
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pytz
+
+# Area covered by the precomputed grid (the continental US) and the size of its cells in degrees
+GRID_BOUNDS = (24.0, -125.0, 50.0, -66.0) # min lat, min lon, max lat, max lon
+GRID_CELL_SIZE = 0.25
+
+# Samples per side taken inside each cell when building the grid; a cell is only answered from the grid when every sample agrees
+GRID_SAMPLES = 3
+
+
+# Define function to return the timezone object for a timezone name, building each one only once
+@lru_cache(maxsize=None)
+def tz_object(timezone_str):
+    return pytz.timezone(timezone_str)
+
+
+# Define the timezone resolver
+# Points inside a grid cell that lies entirely within one timezone are answered by an array lookup, points in cells crossed by a border (or outside the grid) fall back to the polygon test
+class TimezoneResolver:
+    def __init__(self, bounds=GRID_BOUNDS, cell_size=GRID_CELL_SIZE, samples=GRID_SAMPLES):
+        import timezonefinder # only needed once a resolver is built
+        self.finder = timezonefinder.TimezoneFinder()
+        self.bounds = bounds
+        self.cell_size = cell_size
+        min_lat, min_lon, max_lat, max_lon = bounds
+        self.rows = int(np.ceil((max_lat - min_lat) / cell_size))
+        self.cols = int(np.ceil((max_lon - min_lon) / cell_size))
+        self.names = [] # timezone names, indexed by the codes stored in the grid
+        codes = {}
+        # Sample each cell on a regular pattern strictly inside it
+        offsets = (np.arange(samples) + 0.5) / samples * cell_size
+        self.grid = np.full((self.rows, self.cols), -1, dtype=np.int16) # -1 marks cells that need the polygon test
+        for row in range(self.rows):
+            for col in range(self.cols):
+                found = {self.finder.timezone_at(lat=min_lat + row * cell_size + d_lat, lng=min_lon + col * cell_size + d_lon) for d_lat in offsets for d_lon in offsets}
+                if len(found) == 1 and None not in found:
+                    timezone_str = found.pop()
+                    if timezone_str not in codes:
+                        codes[timezone_str] = len(self.names)
+                        self.names.append(timezone_str)
+                    self.grid[row, col] = codes[timezone_str]
+        # Borders can cut through a cell between its samples, so a cell is only trusted when its eight neighbours agree with it too
+        padded = np.pad(self.grid, 1, constant_values=-1)
+        agrees = np.ones(self.grid.shape, dtype=bool)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                agrees &= padded[1 + d_row:1 + d_row + self.rows, 1 + d_col:1 + d_col + self.cols] == self.grid
+        self.grid[~agrees] = -1
+        self._names = np.array(self.names + [None], dtype=object) # code -1 maps to None
+
+    # Define function to find the grid code for each point (-1 when the grid cannot answer)
+    def _codes(self, lats, lons):
+        min_lat, min_lon, _, _ = self.bounds
+        rows = np.floor((np.asarray(lats, dtype=np.float64) - min_lat) / self.cell_size).astype(np.int64)
+        cols = np.floor((np.asarray(lons, dtype=np.float64) - min_lon) / self.cell_size).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        codes = np.full(rows.shape, -1, dtype=np.int16)
+        codes[inside] = self.grid[rows[inside], cols[inside]]
+        return codes
+
+    # Return the timezone name at a point, None if it cannot be determined
+    def timezone_at(self, lat, lon):
+        row = math.floor((lat - self.bounds[0]) / self.cell_size)
+        col = math.floor((lon - self.bounds[1]) / self.cell_size)
+        if 0 <= row < self.rows and 0 <= col < self.cols and self.grid[row, col] >= 0:
+            return self.names[self.grid[row, col]]
+        return self.finder.timezone_at(lat=lat, lng=lon)
+
+    # Return an array of timezone names for arrays of points, running the polygon test only for the points the grid cannot answer
+    def timezones_at(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        codes = self._codes(lats, lons)
+        names = self._names[codes]
+        for position in np.flatnonzero(codes < 0):
+            names[position] = self.finder.timezone_at(lat=lats[position], lng=lons[position])
+        return names
+
+    def timezone(self, lat, lon):
+        timezone_str = self.timezone_at(lat, lon)
+        return tz_object(timezone_str) if timezone_str else None
+
+
+# Define the resolver shared by the whole process, built the first time it is needed
+_resolver = None
+_resolver_lock = threading.Lock()
+
+def get_resolver():
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = TimezoneResolver()
+        return _resolver
+
+
+# Define function to derive the local month, day of week and hour from arrays of UTC timestamps and timezone names
+# Rows that share a timezone are converted together; rows without a timestamp or a timezone get NaN, so callers can leave them unscored
+def local_time_features(timestamps_utc, timezone_names):
+    timestamps_utc = pd.DatetimeIndex(pd.to_datetime(timestamps_utc, utc=True))
+    zones = pd.Series(timezone_names)
+    months = np.full(len(timestamps_utc), np.nan)
+    days = np.full(len(timestamps_utc), np.nan)
+    hours = np.full(len(timestamps_utc), np.nan)
+    for zone in zones.dropna().unique():
+        positions = np.flatnonzero(zones == zone)
+        local = timestamps_utc[positions].tz_convert(tz_object(zone))
+        months[positions] = local.month
+        days[positions] = local.dayofweek
+        hours[positions] = local.hour
+    return months, days, hours
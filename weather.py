@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from backends import weather_client
+from caching import TTLCache
+
+# Define OpenWeatherMap's current weather API URL (OPENWEATHERMAP_URL points it elsewhere, such as the benchmark stand-in server)
+OPENWEATHERMAP_URL = os.environ.get("OPENWEATHERMAP_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+
+# Define function to convert an OpenWeatherMap response into the weather features the model was trained on
+def weather_features(weather_data):
+    return {
+        "Temperature(F)": weather_data['main']['temp'],
+        "Pressure(in)": weather_data['main']['pressure'] * 0.2953, # convert API data from hPA to inHg
+        "Visibility(mi)": weather_data['visibility'] / 1609.34, # convert API data from meters to miles
+        "Humidity(%)": weather_data['main']['humidity'],
+        "Wind_Speed(mph)": weather_data['wind']['speed'],
+    }
+
+
+# Weather providers return the current conditions at a location in the shape of an OpenWeatherMap response (None if they could not be retrieved) and any warnings raised
+
+# Define the provider that fetches weather data from OpenWeatherMap
+class OpenWeatherMapProvider:
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def fetch(self, lat, lon):
+        response, warnings = weather_client.get(OPENWEATHERMAP_URL, params={"lat": lat, "lon": lon, "appid": self.api_key, "units": "imperial"})
+        if response is not None:
+            return response.json(), warnings
+        else:
+            return None, warnings
+
+# Define the provider that answers from a local JSON file instead of the network, for load tests and offline runs
+# The file holds either one OpenWeatherMap response used everywhere, or a list of responses (each with "coord") from which the nearest is returned
+class FileWeatherProvider:
+    def __init__(self, path):
+        with open(path) as file:
+            data = json.load(file)
+        self.responses = data if isinstance(data, list) else [data]
+
+    def fetch(self, lat, lon):
+        if len(self.responses) == 1:
+            return self.responses[0], []
+        return min(self.responses, key=lambda response: (response['coord']['lat'] - lat) ** 2 + (response['coord']['lon'] - lon) ** 2), []
+
+# Define function to choose the weather provider, using the file named by WEATHER_PROVIDER_FILE when it is set
+def weather_provider(api_key):
+    path = os.environ.get("WEATHER_PROVIDER_FILE")
+    if path:
+        return FileWeatherProvider(path)
+    return OpenWeatherMapProvider(api_key)
+
+
+# Define the weather cache, shared by every session in the process
+# Locations in the same grid cell and time bucket share one entry, and concurrent requests for an entry that is being fetched wait for that fetch instead of starting their own
+# When a fetch fails the cell's last weather from up to stale_seconds ago is returned instead (without being cached, so the next request tries again)
+# Returns the weather and the warnings raised by the fetch, which requests waiting on that fetch share
+class WeatherCache:
+    def __init__(self, provider, cell_size=0.05, bucket_seconds=600, max_entries=2048, stale_seconds=3*60*60):
+        self.provider = provider
+        self.cell_size = cell_size # degrees (0.05 degrees is about 5.5 km)
+        self.bucket_seconds = bucket_seconds
+        self.cache = TTLCache(max_entries=max_entries, ttl=bucket_seconds)
+        self.last_known = TTLCache(max_entries=max_entries, ttl=stale_seconds) # grid cell -> last weather fetched for it
+        self.coalesced = 0 # requests that waited on another request's fetch
+        self.stale = 0 # failed fetches answered with the last known weather
+        self._in_flight = {} # key -> Future of the fetch in progress
+        self._lock = threading.Lock()
+
+    def key(self, lat, lon, now=None):
+        now = time.time() if now is None else now
+        return (round(lat / self.cell_size), round(lon / self.cell_size), int(now // self.bucket_seconds))
+
+    def get(self, lat, lon):
+        key = self.key(lat, lon)
+        found, weather_data = self.cache.get(key)
+        if found:
+            return weather_data, []
+        with self._lock:
+            # Check again now that no other fetch can finish in between
+            found, weather_data = self.cache.get(key, record=False)
+            if found:
+                return weather_data, []
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        weather_data, warnings = None, []
+        try:
+            weather_data, warnings = self.provider.fetch(lat, lon)
+            if weather_data is not None: # failures are not cached so the next request tries again
+                self.cache.set(key, weather_data)
+                self.last_known.set(key[:2], weather_data)
+            else:
+                found, weather_data = self.last_known.get(key[:2], record=False)
+                self.stale += found
+                if found:
+                    warnings = warnings + ["Showing the last known weather for this area."]
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_result((weather_data, warnings))
+        return weather_data, warnings
+
+    def stats(self):
+        return dict(self.cache.stats(), coalesced=self.coalesced, stale=self.stale)